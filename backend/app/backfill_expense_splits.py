@@ -0,0 +1,54 @@
+"""Backfill the expense_splits table for expenses created before it existed.
+
+Creates the table if needed and derives each member's share from the expense's
+split type, exactly as it is computed at write time. Safe to re-run: expenses that
+already have split rows are skipped.
+
+    python -m app.backfill_expense_splits
+"""
+from sqlalchemy import exists
+from app.database import SessionLocal, engine
+from app import models, operations
+
+BATCH_SIZE = 1000
+
+def backfill_expense_splits(batch_size: int = BATCH_SIZE) -> int:
+    models.ExpenseSplit.__table__.create(bind=engine, checkfirst=True)
+    
+    db = SessionLocal()
+    member_ids_by_group = {}
+    backfilled = 0
+    last_id = 0
+    
+    try:
+        while True:
+            expenses = db.query(models.Expense).filter(
+                models.Expense.id > last_id,
+                ~exists().where(models.ExpenseSplit.expense_id == models.Expense.id)
+            ).order_by(models.Expense.id).limit(batch_size).all()
+            
+            if not expenses:
+                break
+            
+            for expense in expenses:
+                if expense.group_id not in member_ids_by_group:
+                    group = operations.get_group(db, expense.group_id)
+                    member_ids_by_group[expense.group_id] = [user.id for user in group.users]
+                
+                shares = operations.compute_expense_shares(expense, member_ids_by_group[expense.group_id])
+                operations.record_expense_splits(db, expense, shares)
+            
+            last_id = expenses[-1].id
+            backfilled += len(expenses)
+            db.commit()
+            db.expunge_all()
+            
+            print(f"Backfilled splits for {backfilled} expenses...")
+    finally:
+        db.close()
+    
+    return backfilled
+
+if __name__ == "__main__":
+    total = backfill_expense_splits()
+    print(f"Backfill complete: {total} expenses updated.")
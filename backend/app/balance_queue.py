@@ -0,0 +1,136 @@
+"""Write-behind aggregation of balance updates.
+
+With BALANCE_WRITE_BEHIND enabled, creating an expense stores one pending delta per
+affected member in the same transaction as the expense instead of updating the hot
+`balances` rows. A background worker coalesces the pending deltas per (user, group)
+and applies them in batched transactions. Balance reads add unapplied deltas on the fly.
+The same worker also applies the expenses' queued spending rollup increments.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+from sqlalchemy import and_, bindparam, func, insert, update
+from sqlalchemy.orm import Session
+
+from . import models, rollups
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("BALANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("BALANCE_FLUSH_INTERVAL", "1.0"))
+FLUSH_BATCH_SIZE = int(os.getenv("BALANCE_FLUSH_BATCH_SIZE", "5000"))
+
+def enqueue_balance_deltas(db: Session, expense: models.Expense, deltas: Dict[int, float]):
+    """Record pending deltas for an expense; the caller commits them with the expense"""
+    rows = [
+        {"user_id": user_id, "group_id": expense.group_id, "expense_id": expense.id, "delta": delta}
+        for user_id, delta in deltas.items() if delta != 0
+    ]
+    if rows:
+        # One executemany instead of an ORM insert per member
+        db.execute(insert(models.PendingBalanceDelta), rows)
+
+def pending_totals_subquery(db: Session):
+    """Unapplied deltas summed per (user, group), for joining onto balance reads"""
+    return db.query(
+        models.PendingBalanceDelta.user_id.label("user_id"),
+        models.PendingBalanceDelta.group_id.label("group_id"),
+        func.sum(models.PendingBalanceDelta.delta).label("delta")
+    ).group_by(
+        models.PendingBalanceDelta.user_id,
+        models.PendingBalanceDelta.group_id
+    ).subquery()
+
+def pending_join_condition(pending):
+    return and_(
+        pending.c.user_id == models.Balance.user_id,
+        pending.c.group_id == models.Balance.group_id
+    )
+
+def flush_pending_deltas(db: Session, batch_size: int = FLUSH_BATCH_SIZE) -> int:
+    """Apply pending deltas to balances in batches. Returns the number of deltas applied."""
+    balances = models.Balance.__table__
+    apply_delta = update(balances).where(
+        and_(
+            balances.c.user_id == bindparam("b_user_id"),
+            balances.c.group_id == bindparam("b_group_id")
+        )
+    ).values(balance=balances.c.balance + bindparam("b_delta"))
+
+    applied = 0
+    while True:
+        # Lock the batch so concurrent flushers (one per server process) never apply a delta twice
+        rows = db.query(
+            models.PendingBalanceDelta.id,
+            models.PendingBalanceDelta.user_id,
+            models.PendingBalanceDelta.group_id,
+            models.PendingBalanceDelta.delta
+        ).order_by(models.PendingBalanceDelta.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+        if not rows:
+            break
+
+        # Coalesce per (user, group) so each hot balance row is written once per batch
+        coalesced: Dict[Tuple[int, int], float] = defaultdict(float)
+        for _, user_id, group_id, delta in rows:
+            coalesced[(user_id, group_id)] += delta
+
+        # Update in (user, group) order, which keeps each group's rows in the user_id order
+        # expense writes and settlements lock them in, so the flush can't deadlock with them
+        db.execute(apply_delta, [
+            {"b_user_id": user_id, "b_group_id": group_id, "b_delta": delta}
+            for (user_id, group_id), delta in sorted(coalesced.items())
+        ])
+        # Delete exactly the rows that were applied; newer deltas stay queued
+        db.query(models.PendingBalanceDelta).filter(
+            models.PendingBalanceDelta.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        applied += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return applied
+
+class BalanceFlushWorker:
+    """Background task that periodically flushes pending balance deltas and rollup increments"""
+
+    def __init__(self, session_factory: Callable[[], Session], interval: float = FLUSH_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    def flush_once(self) -> int:
+        db = self.session_factory()
+        try:
+            applied = flush_pending_deltas(db)
+            rollups.flush_pending_increments(db, FLUSH_BATCH_SIZE)
+            return applied
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Balance flush failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await asyncio.to_thread(self.flush_once)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # The loop performs one last flush after the stop signal, so nothing stays queued
+        self._stopped.set()
+        if self._task is not None:
+            await self._task
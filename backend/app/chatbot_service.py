@@ -2,8 +2,9 @@ import requests
 import json
 from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
-from . import models, operations
+from . import models, operations, rollups, search
 import os
+import re
 from collections import defaultdict
 from datetime import datetime
 
@@ -11,6 +12,16 @@ from datetime import datetime
 HUGGINGFACE_API_URL = "https://router.huggingface.co/sambanova/v1/chat/completions"
 HUGGINGFACE_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN", "")
 
+# Words of a question that say nothing about which expenses it is about. Search terms are
+# matched as prefixes, so these (and words under three letters) would match most expenses.
+QUESTION_STOPWORDS = frozenset("""
+    about all and any are can did does for from had has have her him his how its last many
+    much our she show spend spending spent than that the their them then there they this
+    total was were what when where which who whom why will with you your
+    expense expenses money owe owed owes paid pay payed paying
+""".split())
+MIN_KEYWORD_LENGTH = 3
+
 class ChatbotService:
     def __init__(self):
         self.headers = {
@@ -34,14 +45,6 @@ class ChatbotService:
             users = db.query(models.User).all()
             context["users"] = [{"id": user.id, "name": user.name} for user in users]
             
-            # Initialize statistics
-            total_expenses = 0
-            total_amount = 0.0
-            user_expense_count = defaultdict(int)
-            user_paid_amount = defaultdict(float)
-            group_expense_count = defaultdict(int)
-            group_total_amount = defaultdict(float)
-            
             # Get all groups with detailed information
             groups = db.query(models.Group).all()
             for group in groups:
@@ -54,20 +57,12 @@ class ChatbotService:
                 }
                 context["groups"].append(group_data)
                 
-                # Get expenses for this group
-                expenses = operations.get_group_expenses(db, group.id)
+                # Get expenses for this group (older ones are summed up in the latest checkpoint)
+                expenses = operations.get_group_expenses(db, group.id, since_checkpoint=True)
                 for expense in expenses:
-                    total_expenses += 1
-                    total_amount += expense.amount
-                    
                     payer = next((u for u in users if u.id == expense.paid_by), None)
                     payer_name = payer.name if payer else "Unknown"
                     
-                    user_expense_count[payer_name] += 1
-                    user_paid_amount[payer_name] += expense.amount
-                    group_expense_count[group.name] += 1
-                    group_total_amount[group.name] += expense.amount
-                    
                     expense_data = {
                         "id": expense.id,
                         "description": expense.description,
@@ -97,17 +92,14 @@ class ChatbotService:
                         }
                         context["balances"].append(balance_data)
             
-            # Calculate comprehensive statistics
+            # Statistics come from the daily spending rollups instead of the raw expenses
+            summary = rollups.get_summary_statistics(db)
+            total_expenses = summary["total_expenses"]
             context["statistics"] = {
                 "total_users": len(users),
                 "total_groups": len(groups),
-                "total_expenses": total_expenses,
-                "total_amount_spent": round(total_amount, 2),
-                "average_expense_amount": round(total_amount / total_expenses, 2) if total_expenses > 0 else 0,
-                "most_active_payer": max(user_expense_count.items(), key=lambda x: x[1]) if user_expense_count else None,
-                "highest_spender": max(user_paid_amount.items(), key=lambda x: x[1]) if user_paid_amount else None,
-                "most_active_group": max(group_expense_count.items(), key=lambda x: x[1]) if group_expense_count else None,
-                "group_with_highest_expenses": max(group_total_amount.items(), key=lambda x: x[1]) if group_total_amount else None
+                "average_expense_amount": round(summary["total_amount_spent"] / total_expenses, 2) if total_expenses > 0 else 0,
+                **summary
             }
             
             # Calculate relationships and debts
@@ -126,6 +118,33 @@ class ChatbotService:
             print(f"Error getting comprehensive context: {e}")
             return context
 
+    def get_relevant_expenses(self, db: Session, user_query: str, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve expenses whose descriptions match words of the question, including older ones"""
+        keywords = [
+            word for word in re.findall(r"[^\W_]+", user_query.lower())
+            if len(word) >= MIN_KEYWORD_LENGTH and word not in QUESTION_STOPWORDS
+        ]
+        if not keywords:
+            return []
+        
+        try:
+            results, _ = search.search_expenses(db, " ".join(keywords), user_id=user_id, limit=10, match_any=True)
+        except Exception as e:
+            db.rollback()
+            print(f"Error searching expenses: {e}")
+            return []
+        
+        return [
+            {
+                "description": result["description"],
+                "amount": result["amount"],
+                "paid_by": result["payer_name"],
+                "group_name": result["group_name"],
+                "created_at": result["created_at"].strftime("%Y-%m-%d %H:%M")
+            }
+            for result in results
+        ]
+
     def create_intelligent_prompt(self, context: Dict[str, Any], user_query: str) -> str:
         """Create a comprehensive, intelligent prompt for the LLM"""
         
@@ -158,6 +177,11 @@ Total Users: {context['statistics']['total_users']}
         if len(context["expenses"]) > 10:
             prompt += f"... and {len(context['expenses']) - 10} more expenses\n"
         
+        if context.get("relevant_expenses"):
+            prompt += f"\n=== EXPENSES MATCHING THE QUESTION ===\n"
+            for expense in context["relevant_expenses"]:
+                prompt += f"• {expense['description']}: ₹{expense['amount']} paid by {expense['paid_by']} in '{expense['group_name']}' on {expense['created_at']}\n"
+        
         prompt += f"\n=== CURRENT BALANCES ===\n"
         if context["balances"]:
             for balance in context["balances"]:
@@ -259,6 +283,7 @@ ANSWER:"""
         try:
             # Get comprehensive database context
             context = self.get_comprehensive_context(db, user_id)
+            context["relevant_expenses"] = self.get_relevant_expenses(db, user_query, user_id)
             
             # Create intelligent prompt
             intelligent_prompt = self.create_intelligent_prompt(context, user_query)
@@ -0,0 +1,170 @@
+"""In-process pub/sub for pushing group updates to connected clients.
+
+Writes publish compact events to a channel per group; the `/groups/{id}/events` SSE
+endpoint subscribes to it. The broker is pluggable: `InMemoryBroker` serves a single
+server process, and a broker backed by e.g. Redis pub/sub can be installed with
+`set_broker()` to fan out across processes.
+
+Every subscription has a bounded queue. A consumer that falls behind by more than
+EVENT_QUEUE_SIZE events has its backlog dropped and receives a single `resync` event,
+telling the client to refetch the group instead of replaying deltas.
+"""
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, Tuple
+
+import orjson
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "64"))
+
+Event = Tuple[str, bytes]  # (event type, JSON payload)
+
+RESYNC_EVENT: Event = ("resync", b"{}")
+
+def group_channel(group_id: int) -> str:
+    return f"group:{group_id}"
+
+class Subscription:
+    """A single consumer's bounded queue of events on one channel"""
+
+    __slots__ = ("broker", "channel", "loop", "queue", "dropped")
+
+    def __init__(self, broker: "EventBroker", channel: str, loop: asyncio.AbstractEventLoop, max_queued: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.dropped = 0
+
+    def deliver(self, event: Event):
+        """Queue an event; runs on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: replace the backlog with a single resync marker
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+    async def get(self) -> Event:
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class EventBroker(ABC):
+    """Interface for pub/sub backends"""
+
+    @abstractmethod
+    def publish(self, channel: str, event_type: str, payload: Dict[str, Any]):
+        """Send an event to every current subscriber of `channel`; may be called from any thread"""
+
+    @abstractmethod
+    def subscribe(self, channel: str, max_queued: int = EVENT_QUEUE_SIZE) -> Subscription:
+        """Start receiving `channel`'s events; called on the subscriber's event loop"""
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription):
+        """Stop delivering events to `subscription`"""
+
+class InMemoryBroker(EventBroker):
+    """Delivers events to subscribers in this process.
+
+    `publish` may be called from any thread (sync endpoints run in a threadpool);
+    delivery is handed to each subscriber's event loop with one callback per loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def publish(self, channel: str, event_type: str, payload: Dict[str, Any]):
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        if not subscriptions:
+            return
+
+        # Serialize once, however many subscribers there are
+        event = (event_type, orjson.dumps(payload))
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            by_loop[subscription.loop].append(subscription)
+        for loop, loop_subscriptions in by_loop.items():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_fan_out, loop_subscriptions, event)
+
+    def subscribe(self, channel: str, max_queued: int = EVENT_QUEUE_SIZE) -> Subscription:
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), max_queued)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+def _fan_out(subscriptions, event: Event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+broker: EventBroker = InMemoryBroker()
+
+def set_broker(new_broker: EventBroker):
+    global broker
+    broker = new_broker
+
+def publish_expense_created(expense, balance_deltas: Dict[int, float]):
+    """Compact delta for a new expense: the expense itself, balance changes and the new group version"""
+    broker.publish(group_channel(expense.group_id), "expense_created", {
+        "group_id": expense.group_id,
+        "version": expense.id,  # Expense ids only grow, so the latest one versions the group
+        "expense": {
+            "id": expense.id,
+            "description": expense.description,
+            "amount": expense.amount,
+            "paid_by": expense.paid_by,
+            "split_type": expense.split_type,
+            "created_at": expense.created_at
+        },
+        "balance_deltas": {str(user_id): delta for user_id, delta in balance_deltas.items()}
+    })
+
+def publish_settlement_recorded(settlement):
+    """A payment between two members, as the balance changes it causes.
+
+    Carries no group `version`: versions are expense ids, which tell a client whether its
+    expense list is current, and a settlement doesn't change that list. Balance deltas only
+    add up, so they apply in any order relative to expense events; to skip a settlement a
+    freshly fetched snapshot already includes, compare `settlement.id` with the newest id
+    from GET /groups/{id}/settlements.
+    """
+    broker.publish(group_channel(settlement.group_id), "settlement_recorded", {
+        "group_id": settlement.group_id,
+        "settlement": {
+            "id": settlement.id,
+            "from_user_id": settlement.from_user_id,
+            "to_user_id": settlement.to_user_id,
+            "amount": settlement.amount,
+            "created_at": settlement.created_at
+        },
+        "balance_deltas": {
+            str(settlement.from_user_id): settlement.amount,
+            str(settlement.to_user_id): -settlement.amount
+        }
+    })
+
+def format_sse(event: Event) -> bytes:
+    event_type, data = event
+    return b"event: " + event_type.encode() + b"\ndata: " + data + b"\n\n"
@@ -0,0 +1,244 @@
+"""Settle-up payments and balance checkpoints.
+
+Settlements record a payment between two members of a group and move their balances
+towards zero. A checkpoint snapshots every member's balance as implied by the group's
+history up to its newest expense and settlement, so anything that recomputes balances
+only needs to replay what came after the latest checkpoint. Expenses covered by a
+checkpoint can be moved to the `archived_expenses` table.
+
+Expense and settlement writes hold a shared lock on their group row (`lock_group`) from
+before their ID is drawn until they commit; checkpoints and balance repairs take it
+exclusively. So while a checkpoint holds it, every ID up to the group's current maximum
+belongs to a committed row, and no row with a lower ID can appear later.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas, events
+from app.membership import membership_index
+
+PERCENTAGE_FETCH_SIZE = 10000
+ARCHIVE_BATCH_SIZE = 1000
+
+def get_latest_checkpoint(db: Session, group_id: int) -> Optional[models.BalanceCheckpoint]:
+    return db.query(models.BalanceCheckpoint).filter(
+        models.BalanceCheckpoint.group_id == group_id
+    ).order_by(models.BalanceCheckpoint.id.desc()).first()
+
+def lock_group(db: Session, group_id: int, shared: bool = False):
+    """Lock the group row until the transaction ends: shared for writes, exclusive for snapshots.
+
+    No-op on SQLite, which serializes write transactions anyway.
+    """
+    db.query(models.Group.id).filter(models.Group.id == group_id).with_for_update(read=shared).first()
+
+def get_group_member_ids(db: Session, group_id: int) -> List[int]:
+    return [row.user_id for row in db.query(models.group_users.c.user_id).filter(
+        models.group_users.c.group_id == group_id
+    )]
+
+def expected_group_balances(
+    db: Session,
+    group_id: int,
+    member_ids: List[int],
+    checkpoint: Optional[models.BalanceCheckpoint] = None,
+    last_expense_id: Optional[int] = None,
+    last_settlement_id: Optional[int] = None
+) -> Dict[int, float]:
+    """Balance each member should have, replaying history on top of `checkpoint`.
+
+    Uses the same equal/percentage semantics as operations.update_balances_after_expense.
+    `last_expense_id` / `last_settlement_id` stop the replay at a given point.
+    """
+    expected = {user_id: 0.0 for user_id in member_ids}
+    if not member_ids:
+        return expected
+
+    if checkpoint is not None:
+        for snapshot in checkpoint.balances:
+            if snapshot.user_id in expected:
+                expected[snapshot.user_id] = snapshot.balance
+
+    expense_criteria = [models.Expense.group_id == group_id]
+    settlement_criteria = [models.Settlement.group_id == group_id]
+    if checkpoint is not None:
+        expense_criteria.append(models.Expense.id > checkpoint.last_expense_id)
+        settlement_criteria.append(models.Settlement.id > checkpoint.last_settlement_id)
+    if last_expense_id is not None:
+        expense_criteria.append(models.Expense.id <= last_expense_id)
+    if last_settlement_id is not None:
+        settlement_criteria.append(models.Settlement.id <= last_settlement_id)
+
+    # Payers are credited the full amount of what they paid
+    paid = db.query(models.Expense.paid_by, func.sum(models.Expense.amount)).filter(
+        *expense_criteria
+    ).group_by(models.Expense.paid_by).all()
+    for user_id, total in paid:
+        if user_id in expected:
+            expected[user_id] += total
+
+    # Equal splits debit every member the same amount, so one SUM covers all of them
+    equal_total = db.query(func.sum(models.Expense.amount)).filter(
+        models.Expense.split_type == "equal", *expense_criteria
+    ).scalar() or 0.0
+    equal_share = equal_total / len(member_ids)
+    for user_id in member_ids:
+        expected[user_id] -= equal_share
+
+    # Percentage splits need their JSON, so only those rows are streamed
+    # (keys are matched as strings against members, exactly like the write path)
+    member_keys = {str(user_id): user_id for user_id in member_ids}
+    percentage_shares = defaultdict(float)
+    rows = db.query(models.Expense.amount, models.Expense.splits).filter(
+        models.Expense.split_type == "percentage", *expense_criteria
+    ).yield_per(PERCENTAGE_FETCH_SIZE)
+    for amount, splits in rows:
+        for user_key, percentage in (splits or {}).items():
+            user_id = member_keys.get(user_key)
+            if user_id is not None:
+                percentage_shares[user_id] += amount * percentage
+    for user_id, weighted in percentage_shares.items():
+        expected[user_id] -= weighted / 100
+
+    # Settlements move the payer up and the receiver down
+    sent = db.query(models.Settlement.from_user_id, func.sum(models.Settlement.amount)).filter(
+        *settlement_criteria
+    ).group_by(models.Settlement.from_user_id).all()
+    received = db.query(models.Settlement.to_user_id, func.sum(models.Settlement.amount)).filter(
+        *settlement_criteria
+    ).group_by(models.Settlement.to_user_id).all()
+    for user_id, total in sent:
+        if user_id in expected:
+            expected[user_id] += total
+    for user_id, total in received:
+        if user_id in expected:
+            expected[user_id] -= total
+
+    return expected
+
+# Settlements
+def record_settlement(db: Session, group_id: int, settlement: schemas.SettlementCreate) -> models.Settlement:
+    if settlement.amount <= 0:
+        raise ValueError("Settlement amount must be positive")
+    if settlement.from_user_id == settlement.to_user_id:
+        raise ValueError("A member cannot settle with themselves")
+
+    member_ids = membership_index.get_member_ids(db, group_id) or frozenset()
+    for user_id in (settlement.from_user_id, settlement.to_user_id):
+        if user_id not in member_ids:
+            raise ValueError(f"User with ID {user_id} is not in the group")
+
+    # Keeps checkpoints out until this settlement is committed
+    lock_group(db, group_id, shared=True)
+    db_settlement = models.Settlement(
+        group_id=group_id,
+        from_user_id=settlement.from_user_id,
+        to_user_id=settlement.to_user_id,
+        amount=settlement.amount
+    )
+    db.add(db_settlement)
+
+    # Paying back raises the payer's balance and lowers the receiver's, in the same transaction
+    balances = {
+        balance.user_id: balance
+        for balance in db.query(models.Balance).filter(
+            models.Balance.group_id == group_id,
+            models.Balance.user_id.in_([settlement.from_user_id, settlement.to_user_id])
+        ).order_by(models.Balance.user_id).with_for_update()
+    }
+    balances[settlement.from_user_id].balance += settlement.amount
+    balances[settlement.to_user_id].balance -= settlement.amount
+
+    db.commit()
+    db.refresh(db_settlement)
+
+    events.publish_settlement_recorded(db_settlement)
+    return db_settlement
+
+def get_group_settlements(db: Session, group_id: int, since_checkpoint: bool = False):
+    query = db.query(models.Settlement).filter(models.Settlement.group_id == group_id)
+    if since_checkpoint:
+        checkpoint = get_latest_checkpoint(db, group_id)
+        if checkpoint is not None:
+            query = query.filter(models.Settlement.id > checkpoint.last_settlement_id)
+    return query.order_by(models.Settlement.id).all()
+
+# Checkpoints
+def create_checkpoint(db: Session, group_id: int, archive: bool = False) -> Tuple[models.BalanceCheckpoint, int]:
+    """Snapshot the group's balances as implied by its history, optionally archiving covered expenses.
+
+    Returns the checkpoint and the number of expenses archived.
+    """
+    # Waits for in-flight expenses and settlements of the group, and blocks new ones and
+    # other checkpoints until this one commits, so the maximum IDs below are final
+    lock_group(db, group_id)
+
+    previous = get_latest_checkpoint(db, group_id)
+    # Never move backwards: archived expenses no longer count towards the maximum
+    last_expense_id = max(
+        db.query(func.max(models.Expense.id)).filter(models.Expense.group_id == group_id).scalar() or 0,
+        previous.last_expense_id if previous else 0
+    )
+    last_settlement_id = max(
+        db.query(func.max(models.Settlement.id)).filter(models.Settlement.group_id == group_id).scalar() or 0,
+        previous.last_settlement_id if previous else 0
+    )
+
+    member_ids = get_group_member_ids(db, group_id)
+    expected = expected_group_balances(db, group_id, member_ids, previous, last_expense_id, last_settlement_id)
+
+    checkpoint = models.BalanceCheckpoint(
+        group_id=group_id,
+        last_expense_id=last_expense_id,
+        last_settlement_id=last_settlement_id,
+        balances=[models.CheckpointBalance(user_id=user_id, balance=balance) for user_id, balance in expected.items()]
+    )
+    db.add(checkpoint)
+    db.flush()
+
+    archived = archive_expenses(db, checkpoint) if archive else 0
+
+    db.commit()
+    db.refresh(checkpoint)
+    return checkpoint, archived
+
+def archive_expenses(db: Session, checkpoint: models.BalanceCheckpoint) -> int:
+    """Move expenses covered by a checkpoint to archived_expenses; the caller commits.
+
+    Their expense_splits rows move to archived_expense_splits and they stay in the search
+    index. Expenses whose write-behind balance deltas are still pending stay in place
+    until a later checkpoint.
+    """
+    pending_expense_ids = db.query(models.PendingBalanceDelta.expense_id).filter(
+        models.PendingBalanceDelta.group_id == checkpoint.group_id
+    )
+    expense_ids = [row.id for row in db.query(models.Expense.id).filter(
+        models.Expense.group_id == checkpoint.group_id,
+        models.Expense.id <= checkpoint.last_expense_id,
+        ~models.Expense.id.in_(pending_expense_ids.scalar_subquery())
+    ).order_by(models.Expense.id)]
+
+    columns = ["id", "description", "amount", "paid_by", "group_id", "split_type", "splits", "created_at"]
+    for start in range(0, len(expense_ids), ARCHIVE_BATCH_SIZE):
+        batch = expense_ids[start:start + ARCHIVE_BATCH_SIZE]
+        db.execute(insert(models.ArchivedExpense.__table__).from_select(
+            columns + ["checkpoint_id"],
+            select(*(getattr(models.Expense, column) for column in columns), literal(checkpoint.id)).where(
+                models.Expense.id.in_(batch)
+            )
+        ))
+        db.execute(insert(models.ArchivedExpenseSplit.__table__).from_select(
+            ["expense_id", "user_id", "share_amount"],
+            select(models.ExpenseSplit.expense_id, models.ExpenseSplit.user_id, models.ExpenseSplit.share_amount).where(
+                models.ExpenseSplit.expense_id.in_(batch)
+            )
+        ))
+        db.query(models.ExpenseSplit).filter(
+            models.ExpenseSplit.expense_id.in_(batch)
+        ).delete(synchronize_session=False)
+        db.query(models.Expense).filter(models.Expense.id.in_(batch)).delete(synchronize_session=False)
+
+    return len(expense_ids)
@@ -1,11 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
-from typing import List
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+from datetime import date
+import asyncio
 import time
 import logging
-from app import operations, models, schemas
+from app import operations, models, schemas, balance_queue, rollups, search, events, ledger
 from app.database import SessionLocal, create_tables
+from app.membership import membership_index
 from app.chatbot_service import chatbot_service
 
 # Configure logging
@@ -15,7 +21,26 @@ logger = logging.getLogger(__name__)
 # Create tables
 create_tables()
 
-app = FastAPI(title="Splitwise Clone API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background worker that applies write-behind balance deltas in batches
+    worker = None
+    if balance_queue.WRITE_BEHIND_ENABLED:
+        worker = balance_queue.BalanceFlushWorker(SessionLocal, balance_queue.FLUSH_INTERVAL_SECONDS)
+        worker.start()
+        logger.info(f"Balance write-behind enabled (flush every {balance_queue.FLUSH_INTERVAL_SECONDS}s)")
+    
+    yield
+    
+    if worker is not None:
+        await worker.stop()
+
+app = FastAPI(
+    title="Splitwise Clone API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -49,6 +74,47 @@ def get_db():
     finally:
         db.close()
 
+# Sparse field selection for list endpoints
+# `fields=id,name` returns only those keys of the schema's lean representation
+def parse_fields(fields: Optional[str], schema) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    if not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No fields selected. Allowed: {', '.join(schema.model_fields)}"
+        )
+    unknown = [field for field in requested if field not in schema.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(schema.model_fields)}"
+        )
+    return requested
+
+def lean_response(rows: List[dict], fields: Optional[List[str]]):
+    # Rows are plain dicts built from column queries, so they skip response_model validation
+    if fields is not None:
+        rows = [{field: row[field] for field in fields} for row in rows]
+    return ORJSONResponse(rows)
+
+def list_responses(*row_schemas):
+    # OpenAPI for list endpoints with lean modes: a list of any of the given row schemas.
+    # These routes have no response_model (FastAPI would merge it into this schema), so they
+    # render their full representation with full_response.
+    return {200: {"model": Union[tuple(List[schema] for schema in row_schemas)]}}
+
+GROUP_LIST = TypeAdapter(List[schemas.Group])
+EXPENSE_LIST = TypeAdapter(List[schemas.Expense])
+USER_LIST = TypeAdapter(List[schemas.User])
+
+def full_response(adapter: TypeAdapter, objects) -> Response:
+    # Validates the ORM objects and dumps JSON in one pass through pydantic-core,
+    # skipping FastAPI's jsonable_encoder
+    return Response(adapter.dump_json(adapter.validate_python(objects)), media_type="application/json")
+
 @app.get("/")
 def read_root():
     return {"message": "Splitwise Clone API", "version": "1.0.0"}
@@ -67,9 +133,8 @@ def read_group(group_id: int, db: Session = Depends(get_db)):
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    # Calculate total expenses
-    expenses = operations.get_group_expenses(db, group_id)
-    total_expenses = sum(expense.amount for expense in expenses)
+    # Calculate total expenses (including archived ones)
+    total_expenses = operations.get_group_total_expenses(db, group_id)
     
     group_detail = schemas.GroupDetail(
         id=db_group.id,
@@ -81,10 +146,23 @@ def read_group(group_id: int, db: Session = Depends(get_db)):
     
     return group_detail
 
-@app.get("/groups", response_model=List[schemas.Group])
-def read_groups(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    groups = operations.get_groups(db, skip=skip, limit=limit)
-    return groups
+@app.get("/groups", responses=list_responses(schemas.Group, schemas.GroupSummary, schemas.GroupSummaryFields))
+def read_groups(
+    skip: int = 0,
+    limit: int = 100,
+    summary: bool = False,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """List groups. `summary=true` or `fields=` return schemas.GroupSummary rows instead."""
+    if not summary and fields is None:
+        groups = operations.get_groups(db, skip=skip, limit=limit)
+        return full_response(GROUP_LIST, groups)
+    
+    selected = parse_fields(fields, schemas.GroupSummary)
+    include_members = selected is None or bool({"member_count", "member_ids"} & set(selected))
+    groups = operations.get_group_summaries(db, skip=skip, limit=limit, include_members=include_members)
+    return lean_response(groups, selected)
 
 # Expense endpoints
 @app.post("/groups/{group_id}/expenses", response_model=schemas.Expense)
@@ -93,13 +171,12 @@ def create_expense(
     expense: schemas.ExpenseCreate, 
     db: Session = Depends(get_db)
 ):
-    db_group = operations.get_group(db, group_id=group_id)
-    if db_group is None:
+    member_ids = membership_index.get_member_ids(db, group_id)
+    if member_ids is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
     # Validate payer is in group
-    payer_in_group = any(user.id == expense.paid_by for user in db_group.users)
-    if not payer_in_group:
+    if expense.paid_by not in member_ids:
         raise HTTPException(status_code=400, detail="Payer is not in the group")
     
     # Validate percentage splits if applicable
@@ -113,13 +190,147 @@ def create_expense(
     
     return operations.create_expense(db=db, expense=expense, group_id=group_id)
 
-@app.get("/groups/{group_id}/expenses", response_model=List[schemas.Expense])
-def read_group_expenses(group_id: int, db: Session = Depends(get_db)):
+@app.get(
+    "/groups/{group_id}/expenses",
+    responses=list_responses(schemas.Expense, schemas.ExpenseSummary, schemas.ExpenseSummaryFields)
+)
+def read_group_expenses(
+    group_id: int,
+    summary: bool = False,
+    fields: Optional[str] = None,
+    since_checkpoint: bool = False,
+    db: Session = Depends(get_db)
+):
+    """List a group's expenses. `summary=true` or `fields=` return schemas.ExpenseSummary rows instead.
+    
+    `since_checkpoint=true` only lists expenses not covered by the latest balance checkpoint.
+    """
     db_group = operations.get_group(db, group_id=group_id)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    return operations.get_group_expenses(db, group_id)
+    if not summary and fields is None:
+        expenses = operations.get_group_expenses(db, group_id, since_checkpoint=since_checkpoint)
+        return full_response(EXPENSE_LIST, expenses)
+    
+    selected = parse_fields(fields, schemas.ExpenseSummary)
+    expenses = operations.get_group_expense_summaries(db, group_id, since_checkpoint=since_checkpoint)
+    return lean_response(expenses, selected)
+
+# Settle-up endpoints
+@app.post("/groups/{group_id}/settlements", response_model=schemas.Settlement)
+def create_settlement(group_id: int, settlement: schemas.SettlementCreate, db: Session = Depends(get_db)):
+    """Record a payment from one member to another, moving both balances towards zero"""
+    db_group = operations.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    try:
+        return ledger.record_settlement(db, group_id, settlement)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/groups/{group_id}/settlements", response_model=List[schemas.Settlement])
+def read_group_settlements(group_id: int, since_checkpoint: bool = False, db: Session = Depends(get_db)):
+    db_group = operations.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    return ledger.get_group_settlements(db, group_id, since_checkpoint=since_checkpoint)
+
+@app.post("/groups/{group_id}/checkpoints", response_model=schemas.BalanceCheckpoint)
+def create_checkpoint(group_id: int, archive: bool = False, db: Session = Depends(get_db)):
+    """Snapshot the group's balances; with `archive=true`, move covered expenses to the archive table"""
+    db_group = operations.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    checkpoint, archived = ledger.create_checkpoint(db, group_id, archive=archive)
+    response = schemas.BalanceCheckpoint.model_validate(checkpoint)
+    response.archived_expenses = archived
+    return response
+
+@app.get("/groups/{group_id}/checkpoints/latest", response_model=schemas.BalanceCheckpoint)
+def read_latest_checkpoint(group_id: int, db: Session = Depends(get_db)):
+    checkpoint = ledger.get_latest_checkpoint(db, group_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No checkpoint for this group")
+    return checkpoint
+
+# Statistics endpoints (answered from the daily spending rollups)
+def _format_daily_totals(daily):
+    return [
+        {"date": bucket_date, "expense_count": expense_count, "total_amount": round(total_amount, 2)}
+        for bucket_date, expense_count, total_amount in daily
+    ]
+
+@app.get("/groups/{group_id}/stats")
+def read_group_stats(
+    group_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    db_group = operations.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    payers, daily = rollups.get_group_stats(db, group_id, start, end)
+    
+    return {
+        "group_id": group_id,
+        "group_name": db_group.name,
+        "expense_count": sum(row.expense_count for row in payers),
+        "total_amount": round(sum(row.total_amount for row in payers), 2),
+        "payers": [
+            {
+                "user_id": user_id,
+                "user_name": user_name,
+                "expense_count": expense_count,
+                "total_amount": round(total_amount, 2)
+            }
+            for user_id, user_name, expense_count, total_amount in payers
+        ],
+        "daily": _format_daily_totals(daily)
+    }
+
+# Group event stream (Server-Sent Events)
+EVENT_KEEPALIVE_SECONDS = 15
+
+@app.get("/groups/{group_id}/events")
+async def group_events(group_id: int, request: Request):
+    """Stream compact updates for a group: new expenses with their balance deltas and the new group version"""
+    # Check the group with a short-lived session; the stream itself holds no connection
+    db = SessionLocal()
+    try:
+        db_group = await asyncio.to_thread(operations.get_group, db, group_id)
+    finally:
+        db.close()
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    subscription = events.broker.subscribe(events.group_channel(group_id))
+    
+    async def stream():
+        try:
+            yield b": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                # The next event is only taken once this one is sent, so a slow client
+                # fills its own bounded queue and is told to resync instead
+                yield events.format_sse(event)
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # <------ Balance tracking ------>
 # Balance endpoints
@@ -174,11 +385,137 @@ def read_user_balances(user_id: int, db: Session = Depends(get_db)):
         "group_balances": group_balances
     }
 
+@app.get("/users/{user_id}/stats")
+def read_user_stats(
+    user_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    user = operations.get_user_by_id(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    groups, daily = rollups.get_user_stats(db, user_id, start, end)
+    
+    return {
+        "user_id": user_id,
+        "user_name": user.name,
+        "expense_count": sum(row.expense_count for row in groups),
+        "total_paid": round(sum(row.total_amount for row in groups), 2),
+        "groups": [
+            {
+                "group_id": group_id,
+                "group_name": group_name,
+                "expense_count": expense_count,
+                "total_amount": round(total_amount, 2)
+            }
+            for group_id, group_name, expense_count, total_amount in groups
+        ],
+        "daily": _format_daily_totals(daily)
+    }
+
+@app.get("/users/{user_id}/settlements")
+def read_user_settlements(user_id: int, db: Session = Depends(get_db)):
+    """Minimal transfers that settle the user's position across all of their groups at once"""
+    user = operations.get_user_by_id(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    positions, settlements = operations.calculate_net_settlements(db, user_id=user_id)
+    position = next((row for row in positions if row[0] == user_id), None)
+    
+    return {
+        "user_id": user_id,
+        "user_name": user.name,
+        "net_balance": round(position[2], 2) if position else 0.0,
+        "group_count": position[3] if position else 0,
+        "settlements": settlements
+    }
+
+@app.get("/users/{user_id}/shares")
+def read_user_shares(
+    user_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """User's share of expenses and amount paid per group, optionally from day `start` through day `end`"""
+    user = operations.get_user_by_id(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    group_totals = {}
+    for group_id, group_name, share_total, expense_count in operations.get_user_share_totals(db, user_id, start, end):
+        group_totals[group_id] = {
+            "group_id": group_id,
+            "group_name": group_name,
+            "share": round(share_total, 2),
+            "paid": 0.0,
+            "expense_count": expense_count
+        }
+    for group_id, group_name, paid_total, _ in operations.get_user_paid_totals(db, user_id, start, end):
+        group_totals.setdefault(group_id, {
+            "group_id": group_id,
+            "group_name": group_name,
+            "share": 0.0,
+            "paid": 0.0,
+            "expense_count": 0
+        })["paid"] = round(paid_total, 2)
+    
+    group_shares = list(group_totals.values())
+    
+    return {
+        "user_id": user_id,
+        "user_name": user.name,
+        "total_share": round(sum(group["share"] for group in group_shares), 2),
+        "total_paid": round(sum(group["paid"] for group in group_shares), 2),
+        "group_shares": group_shares
+    }
+
+# Search endpoint
+@app.get("/search/expenses", response_model=schemas.ExpenseSearchPage)
+def search_expenses(
+    q: str,
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Ranked full-text search over expense descriptions in the groups `user_id` belongs to"""
+    user = operations.get_user_by_id(db, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    try:
+        results, next_cursor = search.search_expenses(db, q, user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return schemas.ExpenseSearchPage(results=results, next_cursor=next_cursor)
+
+# Admin endpoints
+@app.get("/admin/settlements")
+def read_global_settlements(db: Session = Depends(get_db)):
+    """Minimal transfers that settle every balance in every group, netted across groups"""
+    positions, settlements = operations.calculate_net_settlements(db)
+    
+    return {
+        "user_count": len(positions),
+        "transfer_count": len(settlements),
+        "settlements": settlements
+    }
+
 # Users endpoint (for frontend to get user list)
-@app.get("/users", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+@app.get("/users", responses=list_responses(schemas.User, schemas.UserFields))
+def read_users(skip: int = 0, limit: int = 100, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """List users. `fields=` returns only the listed schemas.User fields."""
+    if fields is None:
+        users = db.query(models.User).offset(skip).limit(limit).all()
+        return full_response(USER_LIST, users)
+    
+    selected = parse_fields(fields, schemas.User)
+    return lean_response(operations.get_user_rows(db, skip=skip, limit=limit), selected)
 
 # Chatbot endpoint
 @app.post("/chat", response_model=schemas.ChatResponse)
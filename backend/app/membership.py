@@ -0,0 +1,98 @@
+"""In-process membership and identity cache for the write path.
+
+Keeps group_id -> frozenset of member user IDs, so validating a payer and computing
+splits never materializes the group's User objects. Also remembers which user IDs exist
+and the ID behind each email. Entries are loaded with ID-only queries on first use and
+the group's entry is invalidated whenever its membership changes (operations.create_group).
+Empty member sets are never cached, since a group's members are committed together with
+it. Each of the three caches holds at most MEMBERSHIP_CACHE_SIZE entries.
+
+Memberships are only changed through this process's write path; with several server
+processes, a membership change must also call `invalidate` in the others.
+"""
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+
+class MembershipIndex:
+    def __init__(self, max_entries: int = MEMBERSHIP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._members: Dict[int, FrozenSet[int]] = {}
+        self._known_user_ids: Dict[int, None] = {}  # Used as an insertion-ordered set
+        self._email_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, cache: dict, key, value):
+        """Add an entry, evicting the oldest one when full (dicts keep insertion order); hold the lock"""
+        if key not in cache and len(cache) >= self.max_entries:
+            cache.pop(next(iter(cache)))
+        cache[key] = value
+
+    # Group membership
+    def get_member_ids(self, db: Session, group_id: int) -> Optional[FrozenSet[int]]:
+        """Member IDs of a group, or None if the group does not exist"""
+        members = self._members.get(group_id)
+        if members is not None:
+            return members
+
+        members = frozenset(row.user_id for row in db.query(models.group_users.c.user_id).filter(
+            models.group_users.c.group_id == group_id
+        ))
+        if not members:
+            # Not cached: the group may be missing, or its creation not committed yet
+            if db.query(models.Group.id).filter(models.Group.id == group_id).first() is None:
+                return None
+            return members
+
+        with self._lock:
+            self._store(self._members, group_id, members)
+        return members
+
+    def is_member(self, db: Session, group_id: int, user_id: int) -> bool:
+        members = self.get_member_ids(db, group_id)
+        return members is not None and user_id in members
+
+    def invalidate(self, group_id: int):
+        with self._lock:
+            self._members.pop(group_id, None)
+
+    # User identity
+    def missing_user_ids(self, db: Session, user_ids: Iterable[int]) -> List[int]:
+        """IDs from `user_ids` that do not belong to any user, checked with at most one query"""
+        user_ids = list(user_ids)
+        unknown = {user_id for user_id in user_ids if user_id not in self._known_user_ids}
+        if unknown:
+            found = {row.id for row in db.query(models.User.id).filter(models.User.id.in_(unknown))}
+            with self._lock:
+                for user_id in found:
+                    self._store(self._known_user_ids, user_id, None)
+            unknown -= found
+        return [user_id for user_id in user_ids if user_id in unknown]
+
+    def user_id_for_email(self, db: Session, email: str) -> Optional[int]:
+        user_id = self._email_ids.get(email)
+        if user_id is None:
+            user_id = db.query(models.User.id).filter(models.User.email == email).scalar()
+            if user_id is not None:
+                self.remember_user(user_id, email)
+        return user_id
+
+    def remember_user(self, user_id: int, email: Optional[str] = None):
+        with self._lock:
+            self._store(self._known_user_ids, user_id, None)
+            if email is not None:
+                self._store(self._email_ids, email, user_id)
+
+    def clear(self):
+        with self._lock:
+            self._members.clear()
+            self._known_user_ids.clear()
+            self._email_ids.clear()
+
+membership_index = MembershipIndex()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Table, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Table, JSON, Index, UniqueConstraint, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -51,6 +51,26 @@ class Expense(Base):
     # Relationships
     payer = relationship("User", back_populates="expenses_paid")
     group = relationship("Group", back_populates="expenses")
+    shares = relationship("ExpenseSplit", back_populates="expense", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Per-group reads and replays after a checkpoint (Expense.id > last_expense_id)
+        Index("ix_expenses_group_id_id", "group_id", "id"),
+        # Never reuse IDs on SQLite: archived expenses keep theirs and checkpoints compare against them
+        {"sqlite_autoincrement": True},
+    )
+
+class ExpenseSplit(Base):
+    __tablename__ = "expense_splits"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    expense_id = Column(Integer, ForeignKey("expenses.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    share_amount = Column(Float, nullable=False)  # Amount of the expense this user is responsible for
+    
+    # Relationships
+    expense = relationship("Expense", back_populates="shares")
+    user = relationship("User")
 
 class Balance(Base):
     __tablename__ = "balances"
@@ -62,4 +82,150 @@ class Balance(Base):
     
     # Relationships
     user = relationship("User")
-    group = relationship("Group")
\ No newline at end of file
+    group = relationship("Group")
+    
+    __table_args__ = (
+        Index("uq_balances_group_user", "group_id", "user_id", unique=True),
+    )
+
+class PendingBalanceDelta(Base):
+    __tablename__ = "pending_balance_deltas"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    expense_id = Column(Integer, ForeignKey("expenses.id"), nullable=False)
+    delta = Column(Float, nullable=False)  # Amount still to be added to the matching Balance row
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_pending_balance_deltas_user_group", "user_id", "group_id"),
+    )
+
+class SpendingRollup(Base):
+    __tablename__ = "spending_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_date = Column(Date, nullable=False)  # Day the expenses were created (UTC)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    paid_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    expense_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    
+    __table_args__ = (
+        UniqueConstraint("bucket_date", "group_id", "paid_by", name="uq_spending_rollups_bucket"),
+        Index("ix_spending_rollups_group_date", "group_id", "bucket_date"),
+        Index("ix_spending_rollups_payer_date", "paid_by", "bucket_date"),
+    )
+
+class PendingRollupIncrement(Base):
+    __tablename__ = "pending_rollup_increments"
+
+    # One row per expense written in write-behind mode, still to be added to its SpendingRollup bucket
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_date = Column(Date, nullable=False)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    paid_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Float, nullable=False)
+
+class Settlement(Base):
+    __tablename__ = "settlements"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    from_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Member paying back
+    to_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Member receiving the payment
+    amount = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    from_user = relationship("User", foreign_keys=[from_user_id])
+    to_user = relationship("User", foreign_keys=[to_user_id])
+
+class BalanceCheckpoint(Base):
+    __tablename__ = "balance_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    last_expense_id = Column(Integer, nullable=False, default=0)  # Newest expense included in the snapshot
+    last_settlement_id = Column(Integer, nullable=False, default=0)  # Newest settlement included in the snapshot
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    balances = relationship("CheckpointBalance", back_populates="checkpoint", cascade="all, delete-orphan")
+
+class CheckpointBalance(Base):
+    __tablename__ = "checkpoint_balances"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    checkpoint_id = Column(Integer, ForeignKey("balance_checkpoints.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    balance = Column(Float, nullable=False)
+    
+    # Relationships
+    checkpoint = relationship("BalanceCheckpoint", back_populates="balances")
+
+class ArchivedExpense(Base):
+    __tablename__ = "archived_expenses"
+    
+    # Same columns as Expense; rows keep their original IDs when moved here
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    paid_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    split_type = Column(String, nullable=False)
+    splits = Column(JSON)
+    created_at = Column(DateTime)
+    checkpoint_id = Column(Integer, ForeignKey("balance_checkpoints.id"), nullable=False)
+
+class ArchivedExpenseSplit(Base):
+    __tablename__ = "archived_expense_splits"
+    
+    # expense_splits rows of archived expenses, moved together with them
+    id = Column(Integer, primary_key=True, index=True)
+    expense_id = Column(Integer, ForeignKey("archived_expenses.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    share_amount = Column(Float, nullable=False)
+
+# Full-text index over expense descriptions, live and archived (see app/search.py).
+# SQLite uses an external-content FTS5 table kept in sync by triggers; archived expenses
+# keep their entries when they leave `expenses`. Postgres uses a generated tsvector column
+# with a GIN index on both tables, which it keeps in sync by itself.
+EXPENSE_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS expense_search USING fts5(description, content='expenses', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses BEGIN "
+        "INSERT INTO expense_search(rowid, description) VALUES (new.id, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses "
+        "WHEN NOT EXISTS (SELECT 1 FROM archived_expenses WHERE id = old.id) BEGIN "
+        "INSERT INTO expense_search(expense_search, rowid, description) VALUES ('delete', old.id, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE OF description ON expenses BEGIN "
+        "INSERT INTO expense_search(expense_search, rowid, description) VALUES ('delete', old.id, old.description); "
+        "INSERT INTO expense_search(rowid, description) VALUES (new.id, new.description); END",
+    ],
+    "postgresql": [
+        "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(description, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_search_vector ON expenses USING GIN (search_vector)",
+    ],
+}
+
+ARCHIVED_EXPENSE_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE TRIGGER IF NOT EXISTS archived_expenses_search_delete AFTER DELETE ON archived_expenses BEGIN "
+        "INSERT INTO expense_search(expense_search, rowid, description) VALUES ('delete', old.id, old.description); END",
+    ],
+    "postgresql": [
+        "ALTER TABLE archived_expenses ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(description, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_archived_expenses_search_vector ON archived_expenses USING GIN (search_vector)",
+    ],
+}
+
+for _table, _ddl in ((Expense.__table__, EXPENSE_SEARCH_DDL), (ArchivedExpense.__table__, ARCHIVED_EXPENSE_SEARCH_DDL)):
+    for _dialect, _statements in _ddl.items():
+        for _statement in _statements:
+            event.listen(_table, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+
+event.listen(Expense.__table__, "before_drop", DDL("DROP TABLE IF EXISTS expense_search").execute_if(dialect="sqlite"))
\ No newline at end of file
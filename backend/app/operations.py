@@ -1,6 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from . import models, schemas
+from sqlalchemy import and_, bindparam, func, insert, select, union_all, update
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, Iterable, List, Optional
+from datetime import date, datetime, time, timedelta
+from . import models, schemas, balance_queue, rollups, events, ledger
+from .membership import membership_index
 from collections import defaultdict
 
 # User CRUD operations
@@ -10,44 +14,56 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_id(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_user_rows(db: Session, skip: int = 0, limit: int = 100):
+    """Users as plain dicts, without loading ORM objects"""
+    rows = db.query(models.User.id, models.User.name, models.User.email, models.User.created_at).offset(skip).limit(limit)
+    return [row._asdict() for row in rows]
+
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(name=user.name, email=user.email)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    membership_index.remember_user(db_user.id, db_user.email)
     return db_user
 
 def get_or_create_user(db: Session, name: str):
     # Create a simple email from name for demo purposes
     email = f"{name.lower().replace(' ', '.')}@splitwiseclone.com"
-    user = get_user_by_email(db, email)
-    if not user:
-        user_create = schemas.UserCreate(name=name, email=email)
-        user = create_user(db, user_create)
-    return user
+    user_id = membership_index.user_id_for_email(db, email)
+    if user_id is not None:
+        return db.get(models.User, user_id)
+    
+    user_create = schemas.UserCreate(name=name, email=email)
+    return create_user(db, user_create)
 
 # Group CRUD operations
 def create_group(db: Session, group: schemas.GroupCreate):
+    # Validate all members up front, with at most one query
+    user_ids = list(dict.fromkeys(group.user_ids))
+    missing = membership_index.missing_user_ids(db, user_ids)
+    if missing:
+        raise ValueError(f"User with ID {missing[0]} not found")
+    
     db_group = models.Group(name=group.name)
     db.add(db_group)
-    db.commit()
-    db.refresh(db_group)
+    db.flush()
     
-    # Add users to group
-    for user_id in group.user_ids:
-        user = get_user_by_id(db, user_id)
-        if not user:
-            db.rollback()
-            raise ValueError(f"User with ID {user_id} not found")
-        
-        db_group.users.append(user)
-        
-        # Initialize balance for user in this group
-        balance = models.Balance(user_id=user.id, group_id=db_group.id, balance=0.0)
-        db.add(balance)
+    # Add users to group with zero balances, committed together with the group,
+    # so no reader ever sees it without its members
+    if user_ids:
+        db.execute(insert(models.group_users), [
+            {"group_id": db_group.id, "user_id": user_id} for user_id in user_ids
+        ])
+        db.execute(insert(models.Balance), [
+            {"user_id": user_id, "group_id": db_group.id, "balance": 0.0} for user_id in user_ids
+        ])
     
     db.commit()
     db.refresh(db_group)
+    
+    # Membership changed: drop any cached member set for this group
+    membership_index.invalidate(db_group.id)
     return db_group
 
 def get_group(db: Session, group_id: int):
@@ -56,8 +72,33 @@ def get_group(db: Session, group_id: int):
 def get_groups(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Group).offset(skip).limit(limit).all()
 
+def get_group_summaries(db: Session, skip: int = 0, limit: int = 100, include_members: bool = True):
+    """Groups as plain dicts with member IDs instead of user objects (see schemas.GroupSummary)"""
+    groups = [
+        {"id": group_id, "name": name, "created_at": created_at, "member_count": 0, "member_ids": []}
+        for group_id, name, created_at in db.query(
+            models.Group.id, models.Group.name, models.Group.created_at
+        ).offset(skip).limit(limit)
+    ]
+    
+    if include_members and groups:
+        # One query for the memberships of the whole page
+        by_id = {group["id"]: group for group in groups}
+        memberships = db.query(models.group_users.c.group_id, models.group_users.c.user_id).filter(
+            models.group_users.c.group_id.in_(list(by_id))
+        ).order_by(models.group_users.c.group_id, models.group_users.c.user_id)
+        for group_id, user_id in memberships:
+            by_id[group_id]["member_ids"].append(user_id)
+        for group in groups:
+            group["member_count"] = len(group["member_ids"])
+    
+    return groups
+
 # Expense CRUD operations
 def create_expense(db: Session, expense: schemas.ExpenseCreate, group_id: int):
+    # Keeps checkpoints out from before the expense ID is drawn until it is committed
+    ledger.lock_group(db, group_id, shared=True)
+    
     db_expense = models.Expense(
         description=expense.description,
         amount=expense.amount,
@@ -67,78 +108,166 @@ def create_expense(db: Session, expense: schemas.ExpenseCreate, group_id: int):
         splits=expense.splits
     )
     db.add(db_expense)
+    db.flush()
+    
+    # Store every member's share alongside the expense
+    member_ids = membership_index.get_member_ids(db, group_id)
+    shares = compute_expense_shares(db_expense, member_ids)
+    record_expense_splits(db, db_expense, shares)
+    
+    deltas = compute_balance_deltas(db_expense, shares)
+    
+    if balance_queue.WRITE_BEHIND_ENABLED:
+        # Commit the expense together with its pending balance deltas and rollup increment;
+        # the background worker applies them to the balances and rollup rows later
+        balance_queue.enqueue_balance_deltas(db, db_expense, deltas)
+        rollups.enqueue_expense(db, db_expense)
+    else:
+        # Update balances and rollups in the same transaction, so an expense is never visible without them
+        update_balances_after_expense(db, db_expense, shares)
+        rollups.record_expense(db, db_expense)
+    
     db.commit()
     db.refresh(db_expense)
     
-    # Update balances
-    update_balances_after_expense(db, db_expense)
+    # Push the change to clients listening on the group's event stream
+    events.publish_expense_created(db_expense, deltas)
     
     return db_expense
 
-def update_balances_after_expense(db: Session, expense: models.Expense):
-    group = get_group(db, expense.group_id)
+def compute_expense_shares(expense: models.Expense, member_ids: Iterable[int]) -> Dict[int, float]:
+    """Amount each group member owes for an expense"""
+    shares = {}
     
     if expense.split_type == "equal":
         # Split equally among all group members
-        split_amount = expense.amount / len(group.users)
-        
-        for user in group.users:
-            balance = db.query(models.Balance).filter(
-                and_(models.Balance.user_id == user.id, models.Balance.group_id == expense.group_id)
-            ).first()
-            
-            if user.id == expense.paid_by:
-                # Payer gets credited (positive balance)
-                balance.balance += expense.amount - split_amount
-            else:
-                # Others get debited (negative balance)
-                balance.balance -= split_amount
+        split_amount = expense.amount / len(member_ids)
+        for user_id in member_ids:
+            shares[user_id] = split_amount
     
     elif expense.split_type == "percentage":
         # Split based on percentages
-        for user in group.users:
-            balance = db.query(models.Balance).filter(
-                and_(models.Balance.user_id == user.id, models.Balance.group_id == expense.group_id)
-            ).first()
-            
-            user_percentage = expense.splits.get(str(user.id), 0)
-            user_share = expense.amount * (user_percentage / 100)
-            
-            if user.id == expense.paid_by:
-                # Payer gets credited minus their share
-                balance.balance += expense.amount - user_share
-            else:
-                # Others get debited for their share
-                balance.balance -= user_share
+        for user_id in member_ids:
+            user_percentage = expense.splits.get(str(user_id), 0)
+            if user_percentage:
+                shares[user_id] = expense.amount * (user_percentage / 100)
     
-    db.commit()
+    return shares
+
+def compute_balance_deltas(expense: models.Expense, shares: Dict[int, float]) -> Dict[int, float]:
+    """Balance change of every member: others are debited their share, the payer is credited the rest"""
+    deltas = {user_id: -share for user_id, share in shares.items()}
+    deltas[expense.paid_by] = deltas.get(expense.paid_by, 0.0) + expense.amount
+    return deltas
+
+def record_expense_splits(db: Session, expense: models.Expense, shares: Dict[int, float]):
+    if not shares:
+        return
+    # One executemany instead of an ORM insert per member
+    db.execute(insert(models.ExpenseSplit), [
+        {"expense_id": expense.id, "user_id": user_id, "share_amount": share_amount}
+        for user_id, share_amount in shares.items()
+    ])
 
-def get_group_expenses(db: Session, group_id: int):
-    return db.query(models.Expense).filter(models.Expense.group_id == group_id).all()
+def update_balances_after_expense(db: Session, expense: models.Expense, shares: Optional[Dict[int, float]] = None):
+    """Add an expense's balance changes to the stored balances; the caller commits"""
+    if shares is None:
+        shares = compute_expense_shares(expense, membership_index.get_member_ids(db, expense.group_id))
+    
+    # Increment in SQL (one executemany), so concurrent expenses never overwrite each other's changes.
+    # Rows are updated in user_id order, like every other writer of balances, so writers can't deadlock
+    balances = models.Balance.__table__
+    db.execute(update(balances).where(
+        and_(balances.c.group_id == bindparam("b_group_id"), balances.c.user_id == bindparam("b_user_id"))
+    ).values(balance=balances.c.balance + bindparam("b_delta")), [
+        {"b_group_id": expense.group_id, "b_user_id": user_id, "b_delta": delta}
+        for user_id, delta in sorted(compute_balance_deltas(expense, shares).items())
+    ])
+
+def get_group_expenses(db: Session, group_id: int, since_checkpoint: bool = False):
+    query = db.query(models.Expense).filter(models.Expense.group_id == group_id)
+    if since_checkpoint:
+        query = query.filter(models.Expense.id > _checkpoint_expense_id(db, group_id))
+    return query.all()
+
+def _checkpoint_expense_id(db: Session, group_id: int) -> int:
+    """Newest expense covered by the group's latest checkpoint (0 without one)"""
+    return db.query(models.BalanceCheckpoint.last_expense_id).filter(
+        models.BalanceCheckpoint.group_id == group_id
+    ).order_by(models.BalanceCheckpoint.id.desc()).limit(1).scalar() or 0
+
+def get_group_total_expenses(db: Session, group_id: int) -> float:
+    """Sum of all expenses in a group, including archived ones"""
+    live = db.query(func.sum(models.Expense.amount)).filter(models.Expense.group_id == group_id).scalar()
+    archived = db.query(func.sum(models.ArchivedExpense.amount)).filter(
+        models.ArchivedExpense.group_id == group_id
+    ).scalar()
+    return (live or 0.0) + (archived or 0.0)
+
+def get_expense_summaries(db: Session, *criteria, model=models.Expense):
+    """Expenses as plain dicts with the payer's name instead of the payer object (see schemas.ExpenseSummary).
+    
+    With `model=models.ArchivedExpense`, archived expenses are read instead.
+    """
+    rows = db.query(
+        model.id,
+        model.description,
+        model.amount,
+        model.paid_by,
+        model.group_id,
+        model.split_type,
+        model.splits,
+        model.created_at,
+        models.User.name.label("payer_name")
+    ).join(models.User, models.User.id == model.paid_by).filter(*criteria)
+    return [{**row._asdict(), "splits": row.splits or {}} for row in rows]
+
+def get_group_expense_summaries(db: Session, group_id: int, since_checkpoint: bool = False):
+    criteria = [models.Expense.group_id == group_id]
+    if since_checkpoint:
+        criteria.append(models.Expense.id > _checkpoint_expense_id(db, group_id))
+    return get_expense_summaries(db, *criteria)
 
 # Balance CRUD operations
+def _query_balances(db: Session, *criteria):
+    """Load balances with any write-behind deltas not yet applied added on top"""
+    pending = balance_queue.pending_totals_subquery(db)
+    rows = db.query(models.Balance, pending.c.delta).outerjoin(
+        pending, balance_queue.pending_join_condition(pending)
+    ).filter(*criteria).populate_existing().all()
+    
+    balances = []
+    for balance, pending_delta in rows:
+        if pending_delta:
+            # Overlay without marking the row dirty, so the sum is never written back
+            set_committed_value(balance, "balance", balance.balance + pending_delta)
+        balances.append(balance)
+    return balances
+
 def get_group_balances(db: Session, group_id: int):
-    return db.query(models.Balance).filter(models.Balance.group_id == group_id).all()
+    return _query_balances(db, models.Balance.group_id == group_id)
 
 def get_user_balances(db: Session, user_id: int):
-    return db.query(models.Balance).filter(models.Balance.user_id == user_id).all()
+    return _query_balances(db, models.Balance.user_id == user_id)
 
-def calculate_simplified_balances(db: Session, group_id: int):
-    """Calculate who owes whom in simplified form"""
-    balances = get_group_balances(db, group_id)
+def simplify_debts(positions):
+    """Match debtors to creditors, largest amounts first.
     
+    `positions` is a list of (party, net_balance) pairs; returns (debtor, creditor, amount)
+    transfers, at most one fewer than the number of parties with a non-zero balance.
+    """
     # Separate creditors (positive balance) and debtors (negative balance)
     creditors = []
     debtors = []
     
-    for balance in balances:
-        if balance.balance > 0:
-            creditors.append({"user": balance.user, "amount": balance.balance})
-        elif balance.balance < 0:
-            debtors.append({"user": balance.user, "amount": abs(balance.balance)})
+    for party, amount in positions:
+        if amount > 0:
+            creditors.append({"party": party, "amount": amount})
+        elif amount < 0:
+            debtors.append({"party": party, "amount": abs(amount)})
     
     # Calculate simplified transactions
-    transactions = []
+    transfers = []
     
     # Sort by amount for optimal matching
     creditors.sort(key=lambda x: x["amount"], reverse=True)
@@ -152,11 +281,7 @@ def calculate_simplified_balances(db: Session, group_id: int):
         amount = min(creditor["amount"], debtor["amount"])
         
         if amount > 0.01:  # Only add if amount is significant
-            transactions.append({
-                "from_user": debtor["user"].name,
-                "to_user": creditor["user"].name,
-                "amount": round(amount, 2)
-            })
+            transfers.append((debtor["party"], creditor["party"], round(amount, 2)))
         
         creditor["amount"] -= amount
         debtor["amount"] -= amount
@@ -166,4 +291,115 @@ def calculate_simplified_balances(db: Session, group_id: int):
         if debtor["amount"] < 0.01:
             j += 1
     
-    return transactions
\ No newline at end of file
+    return transfers
+
+def calculate_simplified_balances(db: Session, group_id: int):
+    """Calculate who owes whom in simplified form"""
+    balances = get_group_balances(db, group_id)
+    transfers = simplify_debts([(balance.user, balance.balance) for balance in balances])
+    
+    return [
+        {"from_user": debtor.name, "to_user": creditor.name, "amount": amount}
+        for debtor, creditor, amount in transfers
+    ]
+
+# Cross-group settlement
+def get_net_positions(db: Session, user_id: Optional[int] = None):
+    """Net balance of every user summed across groups, as (user_id, user_name, net_balance, group_count) rows.
+    
+    With `user_id`, only the groups that user belongs to are included. Balances of each
+    group sum to zero, so the positions returned always net out to zero as well.
+    """
+    pending = balance_queue.pending_totals_subquery(db)
+    query = db.query(
+        models.User.id,
+        models.User.name,
+        func.sum(models.Balance.balance + func.coalesce(pending.c.delta, 0.0)),
+        func.count(models.Balance.group_id)
+    ).select_from(models.Balance).join(
+        models.User, models.User.id == models.Balance.user_id
+    ).outerjoin(
+        pending, balance_queue.pending_join_condition(pending)
+    )
+    
+    if user_id is not None:
+        user_group_ids = db.query(models.Balance.group_id).filter(models.Balance.user_id == user_id)
+        query = query.filter(models.Balance.group_id.in_(user_group_ids.scalar_subquery()))
+    
+    return query.group_by(models.User.id, models.User.name).all()
+
+def calculate_net_settlements(db: Session, user_id: Optional[int] = None):
+    """Transfers that settle every balance at once, netting each user's position across groups.
+    
+    For a user, the transfers settle all groups they belong to and only those involving
+    them are returned. Without a user, the whole ledger is settled.
+    """
+    positions = get_net_positions(db, user_id)
+    transfers = simplify_debts([((row[0], row[1]), row[2]) for row in positions])
+    
+    settlements = []
+    for (debtor_id, debtor_name), (creditor_id, creditor_name), amount in transfers:
+        if user_id is not None and user_id not in (debtor_id, creditor_id):
+            continue
+        settlements.append({
+            "from_user_id": debtor_id,
+            "from_user": debtor_name,
+            "to_user_id": creditor_id,
+            "to_user": creditor_name,
+            "amount": amount
+        })
+    return positions, settlements
+
+# Spending aggregations over the normalized expense_splits table, including archived expenses
+_EXPENSE_TABLES = (
+    (models.Expense, models.ExpenseSplit),
+    (models.ArchivedExpense, models.ArchivedExpenseSplit)
+)
+
+def _date_range_criteria(created_at, start: Optional[date], end: Optional[date]):
+    """`created_at` from day `start` through day `end`, both inclusive (same as rollups._range_criteria)"""
+    criteria = []
+    if start is not None:
+        criteria.append(created_at >= datetime.combine(start, time.min))
+    if end is not None:
+        criteria.append(created_at < datetime.combine(end + timedelta(days=1), time.min))
+    return criteria
+
+def get_user_share_totals(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None):
+    """User's share of expenses per group for days `start` through `end` (inclusive),
+    as (group_id, group_name, share_total, expense_count) rows"""
+    # Filter each table before the union, so both use their user_id index
+    shares = union_all(*(
+        select(expense.group_id, split.expense_id, split.share_amount).join(
+            expense, expense.id == split.expense_id
+        ).where(split.user_id == user_id, *_date_range_criteria(expense.created_at, start, end))
+        for expense, split in _EXPENSE_TABLES
+    )).subquery()
+    
+    return db.query(
+        models.Group.id,
+        models.Group.name,
+        func.sum(shares.c.share_amount),
+        func.count(shares.c.expense_id)
+    ).select_from(shares).join(
+        models.Group, models.Group.id == shares.c.group_id
+    ).group_by(models.Group.id, models.Group.name).all()
+
+def get_user_paid_totals(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None):
+    """Amount a user paid per group for days `start` through `end` (inclusive),
+    as (group_id, group_name, paid_total, expense_count) rows"""
+    paid = union_all(*(
+        select(expense.group_id, expense.id, expense.amount).where(
+            expense.paid_by == user_id, *_date_range_criteria(expense.created_at, start, end)
+        )
+        for expense, _ in _EXPENSE_TABLES
+    )).subquery()
+    
+    return db.query(
+        models.Group.id,
+        models.Group.name,
+        func.sum(paid.c.amount),
+        func.count(paid.c.id)
+    ).select_from(paid).join(
+        models.Group, models.Group.id == paid.c.group_id
+    ).group_by(models.Group.id, models.Group.name).all()
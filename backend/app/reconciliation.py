@@ -0,0 +1,141 @@
+"""Balance reconciliation and repair job.
+
+Recomputes the balances every group should have from its latest checkpoint plus the
+expenses and settlements after it (see ledger.expected_group_balances), and compares
+them with the stored balances (plus any unapplied write-behind deltas). Groups are
+checked in parallel worker processes and results are streamed back in chunks.
+
+    python -m app.reconciliation                 # report mismatches
+    python -m app.reconciliation --repair        # report and fix them
+    python -m app.reconciliation --workers 8 --chunk-size 200
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models, ledger
+from app.database import SessionLocal, engine
+
+TOLERANCE = 0.01
+
+def reconcile_group(db: Session, group_id: int, repair: bool = False) -> List[Dict]:
+    """Compare stored balances of a group with the expected ones, optionally fixing them"""
+    member_ids = ledger.get_group_member_ids(db, group_id)
+
+    # A repair first waits for in-flight expenses and settlements of the group and keeps new
+    # ones out, then locks the balances against the write-behind flush, so stored balances,
+    # pending deltas and history are all read at one consistent point
+    balance_query = db.query(models.Balance).filter(models.Balance.group_id == group_id)
+    if repair:
+        ledger.lock_group(db, group_id)
+        balance_query = balance_query.order_by(models.Balance.user_id).with_for_update()
+    balances = {balance.user_id: balance for balance in balance_query}
+
+    pending = dict(db.query(
+        models.PendingBalanceDelta.user_id, func.sum(models.PendingBalanceDelta.delta)
+    ).filter(
+        models.PendingBalanceDelta.group_id == group_id
+    ).group_by(models.PendingBalanceDelta.user_id).all())
+
+    # Only history after the latest checkpoint has to be replayed
+    checkpoint = ledger.get_latest_checkpoint(db, group_id)
+    expected_balances = ledger.expected_group_balances(db, group_id, member_ids, checkpoint)
+
+    mismatches = []
+    for user_id, expected in expected_balances.items():
+        balance = balances.get(user_id)
+        actual = None if balance is None else balance.balance + pending.get(user_id, 0.0)
+        if actual is not None and abs(actual - expected) <= TOLERANCE:
+            continue
+
+        mismatches.append({
+            "group_id": group_id,
+            "user_id": user_id,
+            "expected": round(expected, 2),
+            "actual": None if actual is None else round(actual, 2)
+        })
+
+        if repair:
+            # Pending deltas are still applied later, so store the balance without them
+            stored = expected - pending.get(user_id, 0.0)
+            if balance is None:
+                db.add(models.Balance(user_id=user_id, group_id=group_id, balance=stored))
+            else:
+                balance.balance = stored
+
+    if repair:
+        db.commit()
+    else:
+        db.rollback()
+    return mismatches
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after fork
+    engine.dispose(close=False)
+
+def _reconcile_chunk(args) -> Dict:
+    group_ids, repair = args
+    db = SessionLocal()
+    try:
+        mismatches = []
+        for group_id in group_ids:
+            mismatches.extend(reconcile_group(db, group_id, repair))
+        return {"groups_checked": len(group_ids), "mismatches": mismatches}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def reconcile_balances(repair: bool = False, workers: int = None, chunk_size: int = 100) -> Iterator[Dict]:
+    """Reconcile every group, yielding one result per chunk of groups as it completes"""
+    db = SessionLocal()
+    try:
+        group_ids = [row.id for row in db.query(models.Group.id).order_by(models.Group.id)]
+    finally:
+        db.close()
+
+    chunks = [(group_ids[i:i + chunk_size], repair) for i in range(0, len(group_ids), chunk_size)]
+    if not chunks:
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker) as pool:
+        yield from pool.map(_reconcile_chunk, chunks)
+
+def ensure_indexes(bind=engine):
+    """Create the per-group expense and balance indexes on databases that predate them"""
+    for table in (models.Expense.__table__, models.Balance.__table__):
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check stored balances against expenses")
+    parser.add_argument("--repair", action="store_true", help="Fix mismatched balances")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=100, help="Groups per worker task")
+    args = parser.parse_args()
+
+    # Every per-group query filters on group_id; without these each one scans the table
+    ensure_indexes()
+
+    groups_checked = 0
+    mismatch_count = 0
+    for result in reconcile_balances(args.repair, args.workers, args.chunk_size):
+        groups_checked += result["groups_checked"]
+        for mismatch in result["mismatches"]:
+            mismatch_count += 1
+            print(
+                f"group {mismatch['group_id']} user {mismatch['user_id']}: "
+                f"expected {mismatch['expected']}, stored {mismatch['actual']}"
+            )
+
+    action = "repaired" if args.repair else "found"
+    print(f"Checked {groups_checked} groups, {action} {mismatch_count} mismatched balances.")
+
+if __name__ == "__main__":
+    main()
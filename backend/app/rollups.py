@@ -0,0 +1,194 @@
+"""Daily spending rollups per (day, group, payer).
+
+Every expense increments its bucket in the same transaction that stores the expense, so
+statistics and trend charts are answered from the rollups in O(buckets) instead of
+scanning raw expenses. In balance write-behind mode the expense only queues a pending
+increment instead, and the balance flush worker adds them to the buckets in batches, so
+writes by the same payer on the same day don't serialize on their bucket row; statistics
+then trail writes by up to one flush interval. Existing databases are filled with the
+rebuild command:
+
+    python -m app.rollups
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import desc, func, insert, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _bucket(expense: models.Expense):
+    return {"bucket_date": expense.created_at.date(), "group_id": expense.group_id, "paid_by": expense.paid_by}
+
+def record_expense(db: Session, expense: models.Expense):
+    """Add an expense to its rollup bucket; the caller commits"""
+    _increment_buckets(db, [dict(_bucket(expense), expense_count=1, total_amount=expense.amount)])
+
+def enqueue_expense(db: Session, expense: models.Expense):
+    """Queue an expense's rollup increment for flush_pending_increments; the caller commits"""
+    db.add(models.PendingRollupIncrement(amount=expense.amount, **_bucket(expense)))
+
+def _increment_buckets(db: Session, increments: List[Dict]):
+    """Add expense_count/total_amount of each increment to its bucket, creating missing buckets"""
+    table = models.SpendingRollup.__table__
+
+    dialect_insert = _UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        # Atomic upserts (one executemany), safe against concurrent writers creating the same bucket
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket_date", "group_id", "paid_by"],
+            set_={
+                "expense_count": table.c.expense_count + stmt.excluded.expense_count,
+                "total_amount": table.c.total_amount + stmt.excluded.total_amount
+            }
+        )
+        db.execute(stmt, increments)
+        return
+
+    for increment in increments:
+        bucket = {key: increment[key] for key in ("bucket_date", "group_id", "paid_by")}
+        updated = db.query(models.SpendingRollup).filter_by(**bucket).update({
+            models.SpendingRollup.expense_count: models.SpendingRollup.expense_count + increment["expense_count"],
+            models.SpendingRollup.total_amount: models.SpendingRollup.total_amount + increment["total_amount"]
+        }, synchronize_session=False)
+        if not updated:
+            db.add(models.SpendingRollup(
+                expense_count=increment["expense_count"], total_amount=increment["total_amount"], **bucket
+            ))
+
+def flush_pending_increments(db: Session, batch_size: int = 5000) -> int:
+    """Add queued increments to their buckets in batches. Returns the number of expenses applied."""
+    pending = models.PendingRollupIncrement
+    applied = 0
+    while True:
+        # Lock the batch so concurrent flushers never apply an increment twice
+        rows = db.query(
+            pending.id, pending.bucket_date, pending.group_id, pending.paid_by, pending.amount
+        ).order_by(pending.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+        if not rows:
+            break
+
+        # One upsert per bucket; sorted so concurrent flushers lock buckets in the same order
+        buckets: Dict[Tuple, List] = defaultdict(lambda: [0, 0.0])
+        for _, bucket_date, group_id, paid_by, amount in rows:
+            totals = buckets[(bucket_date, group_id, paid_by)]
+            totals[0] += 1
+            totals[1] += amount
+        _increment_buckets(db, [
+            {"bucket_date": bucket_date, "group_id": group_id, "paid_by": paid_by,
+             "expense_count": count, "total_amount": total}
+            for (bucket_date, group_id, paid_by), (count, total) in sorted(buckets.items())
+        ])
+        db.query(pending).filter(pending.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        db.commit()
+
+        applied += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return applied
+
+def rebuild_rollups(db: Session) -> int:
+    """Recompute all rollups from raw and archived expenses in one transaction. Returns the bucket count."""
+    expenses = union_all(*(
+        select(model.created_at, model.group_id, model.paid_by, model.amount)
+        for model in (models.Expense, models.ArchivedExpense)
+    )).subquery()
+    bucket_date = func.date(expenses.c.created_at)
+    buckets = select(
+        bucket_date,
+        expenses.c.group_id,
+        expenses.c.paid_by,
+        func.count(),
+        func.sum(expenses.c.amount)
+    ).group_by(bucket_date, expenses.c.group_id, expenses.c.paid_by)
+
+    db.query(models.SpendingRollup).delete(synchronize_session=False)
+    # Queued increments are already counted by the rebuild
+    db.query(models.PendingRollupIncrement).delete(synchronize_session=False)
+    result = db.execute(insert(models.SpendingRollup.__table__).from_select(
+        ["bucket_date", "group_id", "paid_by", "expense_count", "total_amount"],
+        buckets
+    ))
+    db.commit()
+    return result.rowcount
+
+def _range_criteria(start: Optional[date], end: Optional[date]):
+    """Buckets from day `start` through day `end`, both inclusive (same as operations._date_range_criteria)"""
+    criteria = []
+    if start is not None:
+        criteria.append(models.SpendingRollup.bucket_date >= start)
+    if end is not None:
+        criteria.append(models.SpendingRollup.bucket_date <= end)
+    return criteria
+
+def _totals():
+    return (
+        func.sum(models.SpendingRollup.expense_count).label("expense_count"),
+        func.sum(models.SpendingRollup.total_amount).label("total_amount")
+    )
+
+def daily_totals(db: Session, *criteria):
+    """(bucket_date, expense_count, total_amount) rows in date order"""
+    return db.query(models.SpendingRollup.bucket_date, *_totals()).filter(
+        *criteria
+    ).group_by(models.SpendingRollup.bucket_date).order_by(models.SpendingRollup.bucket_date).all()
+
+def get_group_stats(db: Session, group_id: int, start: Optional[date] = None, end: Optional[date] = None):
+    """Per-payer and per-day totals of a group, for days `start` through `end` (inclusive)"""
+    criteria = [models.SpendingRollup.group_id == group_id, *_range_criteria(start, end)]
+
+    payers = db.query(models.User.id, models.User.name, *_totals()).select_from(models.SpendingRollup).join(
+        models.User, models.User.id == models.SpendingRollup.paid_by
+    ).filter(*criteria).group_by(models.User.id, models.User.name).order_by(desc("total_amount")).all()
+
+    return payers, daily_totals(db, *criteria)
+
+def get_user_stats(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None):
+    """Per-group and per-day totals of what a user paid, for days `start` through `end` (inclusive)"""
+    criteria = [models.SpendingRollup.paid_by == user_id, *_range_criteria(start, end)]
+
+    groups = db.query(models.Group.id, models.Group.name, *_totals()).select_from(models.SpendingRollup).join(
+        models.Group, models.Group.id == models.SpendingRollup.group_id
+    ).filter(*criteria).group_by(models.Group.id, models.Group.name).order_by(desc("total_amount")).all()
+
+    return groups, daily_totals(db, *criteria)
+
+def get_summary_statistics(db: Session):
+    """Overall totals plus the most active payers and groups, for the chatbot context"""
+    expense_count, total_amount = db.query(*_totals()).one()
+
+    def top(entity, join_column, order_by):
+        row = db.query(entity.name, *_totals()).select_from(models.SpendingRollup).join(
+            entity, entity.id == join_column
+        ).group_by(entity.id, entity.name).order_by(desc(order_by)).first()
+        if row is None:
+            return None
+        return (row.name, row.expense_count if order_by == "expense_count" else row.total_amount)
+
+    return {
+        "total_expenses": expense_count or 0,
+        "total_amount_spent": round(total_amount or 0.0, 2),
+        "most_active_payer": top(models.User, models.SpendingRollup.paid_by, "expense_count"),
+        "highest_spender": top(models.User, models.SpendingRollup.paid_by, "total_amount"),
+        "most_active_group": top(models.Group, models.SpendingRollup.group_id, "expense_count"),
+        "group_with_highest_expenses": top(models.Group, models.SpendingRollup.group_id, "total_amount")
+    }
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+
+    # Creates the rollup (and archive) tables if this database predates them
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_rollups(db)} spending rollup buckets.")
+    finally:
+        db.close()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, create_model
 from typing import List, Dict, Optional
 from datetime import datetime
 
@@ -35,6 +35,23 @@ class Group(GroupBase):
 class GroupDetail(Group):
     total_expenses: float = 0.0
 
+class GroupSummary(GroupBase):
+    # Lightweight list representation: member IDs instead of full user objects
+    id: int
+    created_at: datetime
+    member_count: int
+    member_ids: List[int] = []
+
+def partial_schema(schema):
+    """Copy of a schema with every field optional: the rows of a `fields=` response"""
+    return create_model(
+        f"{schema.__name__}Fields",
+        **{name: (Optional[field.annotation], None) for name, field in schema.model_fields.items()}
+    )
+
+UserFields = partial_schema(User)
+GroupSummaryFields = partial_schema(GroupSummary)
+
 # Expense schemas
 class ExpenseBase(BaseModel):
     description: str
@@ -55,6 +72,59 @@ class Expense(ExpenseBase):
     class Config:
         from_attributes = True
 
+class ExpenseSummary(ExpenseBase):
+    # Lightweight list representation: payer name instead of the full payer object
+    id: int
+    group_id: int
+    created_at: datetime
+    payer_name: str
+
+ExpenseSummaryFields = partial_schema(ExpenseSummary)
+
+class ExpenseSearchResult(ExpenseSummary):
+    group_name: str
+    rank: float  # Lower is more relevant
+
+class ExpenseSearchPage(BaseModel):
+    results: List[ExpenseSearchResult] = []
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to fetch the next page
+
+# Settlement schemas
+class SettlementBase(BaseModel):
+    from_user_id: int  # Member paying back
+    to_user_id: int  # Member receiving the payment
+    amount: float
+
+class SettlementCreate(SettlementBase):
+    pass
+
+class Settlement(SettlementBase):
+    id: int
+    group_id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class CheckpointBalance(BaseModel):
+    user_id: int
+    balance: float
+    
+    class Config:
+        from_attributes = True
+
+class BalanceCheckpoint(BaseModel):
+    id: int
+    group_id: int
+    last_expense_id: int
+    last_settlement_id: int
+    created_at: datetime
+    balances: List[CheckpointBalance] = []
+    archived_expenses: int = 0
+    
+    class Config:
+        from_attributes = True
+
 # Balance schemas
 class BalanceBase(BaseModel):
     user_id: int
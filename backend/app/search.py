@@ -0,0 +1,157 @@
+"""Ranked full-text search over expense descriptions.
+
+Backed by the index declared in models.EXPENSE_SEARCH_DDL: SQLite FTS5 (bm25 ranking)
+or a Postgres tsvector column with a GIN index (ts_rank_cd ranking). Archived expenses
+stay searchable. Results are ordered by rank, then id, and paginated with an opaque
+keyset cursor.
+
+Databases created before the index existed are set up with:
+
+    python -m app.search
+"""
+import base64
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app import models, operations
+
+MAX_TERMS = 16
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"[^\W_]+", query.lower())[:MAX_TERMS]
+
+def _sqlite_match(terms: List[str], match_any: bool) -> str:
+    # Quoted prefix terms, so user input can never be parsed as FTS5 syntax
+    return (" OR " if match_any else " ").join(f'"{term}"*' for term in terms)
+
+def _postgres_match(terms: List[str], match_any: bool) -> str:
+    return (" | " if match_any else " & ").join(f"{term}:*" for term in terms)
+
+# Per dialect: FROM clause over live and archived expenses, match condition, rank
+# expression (lower rank is better), and the expense id and group id expressions
+_DIALECT_SQL = {
+    "sqlite": (
+        _sqlite_match,
+        "expense_search LEFT JOIN expenses ON expenses.id = expense_search.rowid "
+        "LEFT JOIN archived_expenses ON archived_expenses.id = expense_search.rowid",
+        "expense_search MATCH :match",
+        "bm25(expense_search)",
+        "expense_search.rowid",
+        "coalesce(expenses.group_id, archived_expenses.group_id)",
+    ),
+    "postgresql": (
+        _postgres_match,
+        "(SELECT id, group_id, search_vector FROM expenses "
+        "UNION ALL SELECT id, group_id, search_vector FROM archived_expenses) AS e",
+        "e.search_vector @@ to_tsquery('english', :match)",
+        # ts_rank_cd is a real; as a double it compares exactly with the cursor's :after_rank
+        "CAST(-ts_rank_cd(e.search_vector, to_tsquery('english', :match)) AS double precision)",
+        "e.id",
+        "e.group_id",
+    ),
+}
+
+def encode_cursor(rank: float, expense_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}:{expense_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return float(rank), int(expense_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def search_expenses(
+    db: Session,
+    query: str,
+    user_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    match_any: bool = False
+):
+    """Expenses whose description matches `query`, best first.
+
+    With `user_id`, only expenses of groups the user belongs to are searched. By default
+    every term must match; `match_any` accepts any term (used for chatbot retrieval).
+    Returns (results, next_cursor).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in _DIALECT_SQL:
+        raise ValueError(f"Full-text search is not supported on {dialect}")
+
+    terms = _terms(query)
+    if not terms:
+        return [], None
+
+    build_match, from_clause, match_clause, rank_expr, id_expr, group_expr = _DIALECT_SQL[dialect]
+    params = {"match": build_match(terms, match_any), "limit": limit + 1}
+
+    conditions = [match_clause]
+    if user_id is not None:
+        conditions.append(f"{group_expr} IN (SELECT group_id FROM group_users WHERE user_id = :user_id)")
+        params["user_id"] = user_id
+    if cursor is not None:
+        params["after_rank"], params["after_id"] = decode_cursor(cursor)
+        conditions.append(f"({rank_expr} > :after_rank OR ({rank_expr} = :after_rank AND {id_expr} > :after_id))")
+
+    rows = db.execute(text(
+        f"SELECT {id_expr} AS id, {rank_expr} AS rank FROM {from_clause} "
+        f"WHERE {' AND '.join(conditions)} ORDER BY rank, id LIMIT :limit"
+    ), params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+
+    if not rows:
+        return [], None
+
+    # Load display columns for the page, then restore rank order
+    ranks = {row.id: row.rank for row in rows}
+    summaries = {
+        summary["id"]: summary
+        for model in (models.Expense, models.ArchivedExpense)
+        for summary in operations.get_expense_summaries(db, model.id.in_(list(ranks)), model=model)
+    }
+    group_names = dict(db.query(models.Group.id, models.Group.name).filter(
+        models.Group.id.in_({summary["group_id"] for summary in summaries.values()})
+    ))
+
+    results = [
+        {**summaries[expense_id], "group_name": group_names[summaries[expense_id]["group_id"]], "rank": rank}
+        for expense_id, rank in ranks.items()
+    ]
+    return results, next_cursor
+
+def ensure_search_index(engine: Engine):
+    """Create the search index for an existing database and fill it from live and archived expenses"""
+    dialect = engine.dialect.name
+    if dialect not in models.EXPENSE_SEARCH_DDL:
+        raise ValueError(f"Full-text search is not supported on {dialect}")
+
+    # Creates archived_expenses if this database predates it
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        if dialect == "sqlite":
+            # Replaced by the version that keeps archived expenses indexed
+            connection.execute(text("DROP TRIGGER IF EXISTS expenses_search_delete"))
+        for statement in models.EXPENSE_SEARCH_DDL[dialect] + models.ARCHIVED_EXPENSE_SEARCH_DDL[dialect]:
+            connection.execute(text(statement))
+        if dialect == "sqlite":
+            # `rebuild` only reads the content table, so archived expenses are added back after it
+            connection.execute(text("INSERT INTO expense_search(expense_search) VALUES ('rebuild')"))
+            connection.execute(text(
+                "INSERT INTO expense_search(rowid, description) SELECT id, description FROM archived_expenses"
+            ))
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    ensure_search_index(engine)
+    print("Expense search index is ready.")
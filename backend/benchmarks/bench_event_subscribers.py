@@ -0,0 +1,54 @@
+"""Idle subscribers on the in-process event broker.
+
+Holds thousands of idle group subscriptions, reports memory per subscriber and the time
+to fan one event out to all of them (published from a worker thread, as sync endpoints
+do), and checks that a consumer which never reads stays bounded and gets a resync.
+
+    python -m benchmarks.bench_event_subscribers --subscribers 10000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app import events
+
+async def run(args):
+    broker = events.InMemoryBroker()
+    channel = events.group_channel(1)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    subscriptions = [broker.subscribe(channel, max_queued=args.queue_size) for _ in range(args.subscribers)]
+    per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / args.subscribers
+    tracemalloc.stop()
+    print(f"{broker.subscriber_count(channel)} idle subscribers, {per_subscriber:.0f} bytes each")
+
+    payload = {"group_id": 1, "version": 1, "balance_deltas": {"1": 60.0, "2": -30.0, "3": -30.0}}
+    start = time.perf_counter()
+    await asyncio.to_thread(broker.publish, channel, "expense_created", payload)
+    events_received = await asyncio.gather(*(subscription.get() for subscription in subscriptions))
+    elapsed = time.perf_counter() - start
+    print(f"fan-out to {len(events_received)} subscribers: {elapsed * 1000:.1f} ms")
+
+    # A consumer that never reads keeps at most `queue_size` events, then a single resync
+    stalled = subscriptions[0]
+    for version in range(args.queue_size * 3):
+        broker.publish(channel, "expense_created", {**payload, "version": version})
+    await asyncio.sleep(0.1)
+    backlog = [stalled.queue.get_nowait() for _ in range(stalled.queue.qsize())]
+    resyncs = sum(1 for event in backlog if event == events.RESYNC_EVENT)
+    print(f"stalled consumer: {len(backlog)} queued (limit {args.queue_size}), {resyncs} resync, {stalled.dropped} dropped")
+
+    for subscription in subscriptions:
+        subscription.close()
+    print(f"after close: {broker.subscriber_count(channel)} subscribers")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--queue-size", type=int, default=events.EVENT_QUEUE_SIZE)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Expense write latency as groups grow, with and without the membership cache.
+
+Each write runs in a fresh session, like a request does. "previous" reproduces the
+old write path: the group's User objects are loaded to validate the payer and again to
+compute shares, each member's split row is inserted through the ORM one at a time,
+and every member's balance row is fetched with its own query.
+
+    python -m benchmarks.bench_membership --sizes 5 50 500 5000 --writes 50
+"""
+from sqlalchemy import and_, event
+
+from app import models, operations, rollups, schemas
+from app.membership import membership_index
+from benchmarks.common import base_parser, make_session_factory, seed_group, timed
+
+def previous_create_expense(db, expense: schemas.ExpenseCreate, group_id: int):
+    group = operations.get_group(db, group_id)
+    if not any(user.id == expense.paid_by for user in group.users):
+        raise ValueError("Payer is not in the group")
+
+    db_expense = models.Expense(group_id=group_id, **expense.model_dump())
+    db.add(db_expense)
+    db.flush()
+
+    group = operations.get_group(db, group_id)
+    shares = operations.compute_expense_shares(db_expense, [user.id for user in group.users])
+    for user_id, share_amount in shares.items():
+        db.add(models.ExpenseSplit(expense_id=db_expense.id, user_id=user_id, share_amount=share_amount))
+    rollups.record_expense(db, db_expense)
+    db.commit()
+
+    for user_id, delta in operations.compute_balance_deltas(db_expense, shares).items():
+        balance = db.query(models.Balance).filter(
+            and_(models.Balance.user_id == user_id, models.Balance.group_id == group_id)
+        ).first()
+        balance.balance += delta
+    db.commit()
+
+def cached_create_expense(db, expense: schemas.ExpenseCreate, group_id: int):
+    # Same validation as the POST /groups/{id}/expenses endpoint
+    member_ids = membership_index.get_member_ids(db, group_id)
+    if expense.paid_by not in member_ids:
+        raise ValueError("Payer is not in the group")
+    operations.create_expense(db, expense, group_id)
+
+def uncached_create_expense(db, expense: schemas.ExpenseCreate, group_id: int):
+    membership_index.clear()
+    cached_create_expense(db, expense, group_id)
+
+VARIANTS = {
+    "previous": previous_create_expense,
+    "uncached": uncached_create_expense,
+    "cached": cached_create_expense
+}
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500, 5000])
+    parser.add_argument("--writes", type=int, default=50)
+    args = parser.parse_args()
+
+    session_factory = make_session_factory(args.url)
+    statements = []
+    event.listen(session_factory.kw["bind"], "before_cursor_execute", lambda *a: statements.append(1))
+
+    for size in args.sizes:
+        db = session_factory()
+        group = seed_group(db, size, name=f"Group {size}")
+        group_id, payer_id = group.id, group.users[0].id
+        db.close()
+
+        print(f"{size} members")
+        membership_index.clear()
+        for name, create in VARIANTS.items():
+            expense = schemas.ExpenseCreate(description=f"{name} write", amount=90.0, paid_by=payer_id, split_type="equal")
+            statements.clear()
+            with timed(f"  {name} x{args.writes}", args.writes):
+                for _ in range(args.writes):
+                    db = session_factory()
+                    try:
+                        create(db, expense, group_id)
+                    finally:
+                        db.close()
+            print(f"    statements per write: {len(statements) / args.writes:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Reconciliation throughput on a large expense table.
+
+Seeds many groups with random equal and percentage expenses, then reconciles a sample
+of groups with and without the per-group indexes and extrapolates to all groups.
+Workers split the groups between them, so the full job takes about that time divided
+by the worker count.
+
+    python -m benchmarks.bench_reconciliation --groups 10000 --members 5 --expenses 2000000
+"""
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import models, reconciliation
+from benchmarks.common import base_parser, make_session_factory, timed
+
+INSERT_BATCH = 50000
+
+def seed(db, args, rng):
+    bind = db.get_bind()
+    user_count = args.groups * args.members
+    with bind.begin() as connection:
+        connection.execute(models.User.__table__.insert(), [
+            {"id": i, "name": f"User {i}", "email": f"user.{i}@bench.local"} for i in range(1, user_count + 1)
+        ])
+        connection.execute(models.Group.__table__.insert(), [
+            {"id": g, "name": f"Group {g}"} for g in range(1, args.groups + 1)
+        ])
+        memberships = [
+            {"group_id": g, "user_id": (g - 1) * args.members + m + 1}
+            for g in range(1, args.groups + 1) for m in range(args.members)
+        ]
+        connection.execute(models.group_users.insert(), memberships)
+        connection.execute(models.Balance.__table__.insert(), [dict(row, balance=0.0) for row in memberships])
+
+    now = datetime.utcnow()
+    for start in range(0, args.expenses, INSERT_BATCH):
+        rows = []
+        for _ in range(min(INSERT_BATCH, args.expenses - start)):
+            group_id = rng.randint(1, args.groups)
+            first_member = (group_id - 1) * args.members + 1
+            percentage = rng.random() < args.percentage_share
+            rows.append({
+                "description": "bench",
+                "amount": round(rng.uniform(1, 200), 2),
+                "paid_by": first_member + rng.randrange(args.members),
+                "group_id": group_id,
+                "split_type": "percentage" if percentage else "equal",
+                "splits": {str(first_member): 60, str(first_member + 1): 40} if percentage else {},
+                "created_at": now
+            })
+        with bind.begin() as connection:
+            connection.execute(models.Expense.__table__.insert(), rows)
+
+def reconcile_sample(db, group_ids):
+    start = time.perf_counter()
+    for group_id in group_ids:
+        reconciliation.reconcile_group(db, group_id)
+    return time.perf_counter() - start
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=5)
+    parser.add_argument("--expenses", type=int, default=2000000)
+    parser.add_argument("--percentage-share", type=float, default=0.2)
+    parser.add_argument("--sample", type=int, default=500, help="Groups reconciled with indexes")
+    parser.add_argument("--unindexed-sample", type=int, default=10, help="Groups reconciled without indexes")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    session_factory = make_session_factory(args.url)
+    db = session_factory()
+    with timed(f"seed {args.expenses:,} expenses in {args.groups:,} groups"):
+        seed(db, args, rng)
+
+    sample = rng.sample(range(1, args.groups + 1), min(args.sample, args.groups))
+    indexes = [index for table in (models.Expense.__table__, models.Balance.__table__) for index in table.indexes]
+
+    with db.get_bind().begin() as connection:
+        for index in indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    # Full scans are slow, so only a few groups are timed without indexes
+    unindexed_sample = sample[:args.unindexed_sample]
+    elapsed = reconcile_sample(db, unindexed_sample)
+    print(f"without indexes: {elapsed / len(unindexed_sample) * 1000:.1f} ms/group, "
+          f"~{elapsed / len(unindexed_sample) * args.groups:,.0f}s for all groups")
+
+    reconciliation.ensure_indexes(db.get_bind())
+    elapsed = reconcile_sample(db, sample)
+    print(f"with indexes: {elapsed / len(sample) * 1000:.2f} ms/group, "
+          f"~{elapsed / len(sample) * args.groups:,.1f}s for all groups")
+    db.close()
+
+if __name__ == "__main__":
+    main()
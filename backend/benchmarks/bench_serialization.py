@@ -0,0 +1,119 @@
+"""Serialization cost of list endpoints: full nested models vs lean summary rows.
+
+Builds 10k in-memory groups and expenses shaped like ORM objects (no database needed)
+and times each response path down to JSON bytes. Full models start from the objects;
+summary rows start from the plain dicts their column queries return. The endpoint rows
+time a whole GET /groups request through FastAPI, the query stubbed to return the objects.
+
+    python -m benchmarks.bench_serialization --items 10000 --members 8
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from app import operations, schemas
+from benchmarks.common import make_session_factory
+
+def build_items(count, member_count):
+    now = datetime.utcnow()
+    users = [
+        SimpleNamespace(id=i, name=f"User {i}", email=f"user.{i}@bench.local", created_at=now)
+        for i in range(member_count * 4)
+    ]
+    groups, expenses = [], []
+    for i in range(count):
+        members = [users[(i + j) % len(users)] for j in range(member_count)]
+        groups.append(SimpleNamespace(id=i, name=f"Group {i}", created_at=now - timedelta(minutes=i), users=members))
+        expenses.append(SimpleNamespace(
+            id=i, description=f"Expense {i}", amount=10.0 + i % 90, paid_by=members[0].id, group_id=i,
+            split_type="equal", splits={}, created_at=now, payer=members[0]
+        ))
+
+    # What the column queries behind summary=true return
+    group_rows = [
+        {"id": g.id, "name": g.name, "created_at": g.created_at,
+         "member_count": len(g.users), "member_ids": [u.id for u in g.users]}
+        for g in groups
+    ]
+    expense_rows = [
+        {"id": e.id, "description": e.description, "amount": e.amount, "paid_by": e.paid_by, "group_id": e.group_id,
+         "split_type": e.split_type, "splits": e.splits, "created_at": e.created_at, "payer_name": e.payer.name}
+        for e in expenses
+    ]
+    return groups, expenses, group_rows, expense_rows
+
+def bench(label, fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(fn())
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<56} {elapsed * 1000:8.1f} ms  {size / 1024:8.0f} KiB")
+
+def endpoint_clients(groups):
+    """GET /groups as it was (response_model + FastAPI's default JSONResponse) and as it is now"""
+    previous = FastAPI()
+
+    @previous.get("/groups", response_model=List[schemas.Group])
+    def read_groups():
+        return groups
+
+    # Returning validated models without a response_model goes through jsonable_encoder
+    @previous.get("/groups/validated", response_class=ORJSONResponse)
+    def read_validated_groups():
+        return [schemas.Group.model_validate(group) for group in groups]
+
+    # app.main seeds users on import, so point it at a throwaway database with the schema
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL_UNPOOLED"] = f"sqlite:///{path}"
+    make_session_factory(os.environ["DATABASE_URL_UNPOOLED"])
+    from app import main as api
+    operations.get_groups = lambda db, skip=0, limit=100: groups
+    api.app.dependency_overrides[api.get_db] = lambda: None
+    return TestClient(previous), TestClient(api.app)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    groups, expenses, group_rows, expense_rows = build_items(args.items, args.members)
+    full_groups = TypeAdapter(List[schemas.Group])
+    full_expenses = TypeAdapter(List[schemas.Expense])
+
+    def full_response(adapter, items):
+        # response_model path: validate from attributes, dump to JSON-able python, render
+        return orjson.dumps(adapter.dump_python(adapter.validate_python(items), mode="json"))
+
+    print(f"{args.items} items, {args.members} members per group")
+    bench("groups: full model + stdlib json (previous)", lambda: json.dumps(
+        full_groups.dump_python(full_groups.validate_python(groups), mode="json")).encode(), args.repeat)
+    bench("groups: full model + orjson", lambda: full_response(full_groups, groups), args.repeat)
+    bench("groups: summary rows + orjson", lambda: orjson.dumps(group_rows), args.repeat)
+    bench("groups: fields=id,name,member_count + orjson", lambda: orjson.dumps(
+        [{k: row[k] for k in ("id", "name", "member_count")} for row in group_rows]), args.repeat)
+    bench("expenses: full model + orjson", lambda: full_response(full_expenses, expenses), args.repeat)
+    bench("expenses: summary rows + orjson", lambda: orjson.dumps(expense_rows), args.repeat)
+
+    previous, current = endpoint_clients(groups)
+    bench("endpoint GET /groups: response_model (previous)", lambda: previous.get("/groups").content, args.repeat)
+    bench("endpoint GET /groups: model_validate + jsonable_encoder", lambda: previous.get(
+        "/groups/validated").content, args.repeat)
+    bench("endpoint GET /groups: TypeAdapter.dump_json", lambda: current.get("/groups").content, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Cross-group net settlement for users who belong to hundreds of groups.
+
+Reports latency and the number of SQL statements per call, which must not grow with
+the number of groups.
+
+    python -m benchmarks.bench_settlements --groups 500 --members 10 --users 2000
+"""
+import random
+import time
+
+from sqlalchemy import event
+
+from app import models, operations
+from benchmarks.common import base_parser, make_session_factory, timed
+
+def seed(db, args, rng):
+    db.add_all([models.User(name=f"User {i}", email=f"user.{i}@bench.local") for i in range(args.users)])
+    db.commit()
+    user_ids = [row.id for row in db.query(models.User.id)]
+    hub_id = user_ids[0]
+
+    # Every group contains the hub user plus random others, with zero-sum balances
+    for g in range(args.groups):
+        member_ids = [hub_id] + rng.sample(user_ids[1:], args.members - 1)
+        group = models.Group(name=f"Group {g}")
+        db.add(group)
+        db.flush()
+        db.execute(models.group_users.insert(), [{"group_id": group.id, "user_id": user_id} for user_id in member_ids])
+
+        amounts = [round(rng.uniform(-100, 100), 2) for _ in member_ids[1:]]
+        amounts.insert(0, -sum(amounts))
+        db.add_all([
+            models.Balance(user_id=user_id, group_id=group.id, balance=amount)
+            for user_id, amount in zip(member_ids, amounts)
+        ])
+    db.commit()
+    return hub_id, user_ids
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    session_factory = make_session_factory(args.url)
+    db = session_factory()
+    with timed("seed"):
+        hub_id, user_ids = seed(db, args, rng)
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *a: statements.append(1))
+
+    statements.clear()
+    with timed(f"hub user ({args.groups} groups) x{args.repeat}", args.repeat):
+        for _ in range(args.repeat):
+            positions, settlements = operations.calculate_net_settlements(db, user_id=hub_id)
+    print(f"  statements per call: {len(statements) // args.repeat}, transfers: {len(settlements)}")
+
+    sample = rng.sample(user_ids, min(args.repeat, len(user_ids)))
+    with timed(f"random users x{len(sample)}", len(sample)):
+        for user_id in sample:
+            operations.calculate_net_settlements(db, user_id=user_id)
+
+    statements.clear()
+    start = time.perf_counter()
+    positions, settlements = operations.calculate_net_settlements(db)
+    elapsed = time.perf_counter() - start
+    print(f"global settlement: {elapsed:.3f}s, {len(positions)} users -> {len(settlements)} transfers, {len(statements)} statements")
+    db.close()
+
+if __name__ == "__main__":
+    main()
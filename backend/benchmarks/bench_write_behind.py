@@ -0,0 +1,122 @@
+"""Expense write throughput on a single hot group: synchronous balances vs write-behind.
+
+Write-behind defers both the balance updates and the spending rollup increment, so the
+flush applies both before the results are compared. Also reports how long each write
+holds the group's hot rows (`balances` and `spending_rollups`, from the first write to
+them until commit): concurrent writers to one group queue behind those row locks, so on
+a row-locking database one hot group can take at most about 1/hold writes per second.
+SQLite locks the whole database instead, so the throughput of concurrent writers only
+shows the difference on Postgres.
+
+    python -m benchmarks.bench_write_behind --expenses 2000 --members 8 --threads 1
+    python -m benchmarks.bench_write_behind --url postgresql://... --threads 16
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from app import balance_queue, models, operations, rollups, schemas
+from benchmarks.common import base_parser, make_session_factory, seed_group, timed
+
+HOT_ROW_WRITE = re.compile(r"^\s*(UPDATE|INSERT INTO) (balances|spending_rollups)\b")
+
+class HotRowTimer:
+    """Time from each transaction's first write to a hot row until its commit"""
+
+    def __init__(self, session_factory):
+        self.holds = []
+        self._local = threading.local()
+        event.listen(session_factory.kw["bind"], "before_cursor_execute", self._statement)
+        event.listen(session_factory, "after_commit", self._end)
+        event.listen(session_factory, "after_rollback", self._end)
+
+    def _statement(self, conn, cursor, statement, *args):
+        if getattr(self._local, "since", None) is None and HOT_ROW_WRITE.match(statement):
+            self._local.since = time.perf_counter()
+
+    def _end(self, session):
+        since, self._local.since = getattr(self._local, "since", None), None
+        if since is not None:
+            self.holds.append(time.perf_counter() - since)
+
+    def report(self, label, writes=None):
+        holds, self.holds = self.holds, []
+        if not holds:
+            print(f"{label}: no transaction holds hot rows")
+            return
+        mean = sum(holds) / len(holds)
+        line = f"{label}: {len(holds)} transactions hold hot rows, {mean * 1000:.2f} ms each"
+        if writes:
+            line += f" (at most ~{1 / mean:,.0f} writes/s on one hot group)"
+        print(line)
+
+def write_expenses(session_factory, group_id, member_ids, count, threads):
+    def worker(worker_index):
+        db = session_factory()
+        try:
+            for i in range(worker_index, count, threads):
+                expense = schemas.ExpenseCreate(
+                    description=f"Groceries {i}",
+                    amount=10.0 + i % 50,
+                    paid_by=member_ids[i % len(member_ids)],
+                    split_type="equal",
+                    splits={}
+                )
+                operations.create_expense(db, expense, group_id)
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+
+def run(session_factory, timer, write_behind, args):
+    balance_queue.WRITE_BEHIND_ENABLED = write_behind
+    db = session_factory()
+    group = seed_group(db, args.members, name="Write Behind" if write_behind else "Synchronous")
+    group_id, member_ids = group.id, [user.id for user in group.users]
+    db.close()
+    timer.holds.clear()
+
+    label = "write-behind" if write_behind else "synchronous"
+    with timed(f"{label:>12} writes", args.expenses):
+        write_expenses(session_factory, group_id, member_ids, args.expenses, args.threads)
+    timer.report(f"{label:>12} hot rows", args.expenses)
+
+    db = session_factory()
+    try:
+        if write_behind:
+            with timed(f"{label:>12} flush"):
+                balance_queue.flush_pending_deltas(db)
+                rollups.flush_pending_increments(db)
+            timer.report(f"{label:>12} flush")
+        balances = sorted(round(b.balance, 6) for b in operations.get_group_balances(db, group_id))
+        # Payers differ between the two groups, so compare the per-payer rollups by position
+        buckets = [
+            (bucket.expense_count, round(bucket.total_amount, 6))
+            for bucket in db.query(models.SpendingRollup).filter(
+                models.SpendingRollup.group_id == group_id
+            ).order_by(models.SpendingRollup.paid_by)
+        ]
+        return balances, buckets
+    finally:
+        db.close()
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--expenses", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent writers (keep 1 on SQLite)")
+    args = parser.parse_args()
+
+    session_factory = make_session_factory(args.url)
+    timer = HotRowTimer(session_factory)
+    synchronous = run(session_factory, timer, False, args)
+    write_behind = run(session_factory, timer, True, args)
+    print("balances match:", synchronous[0] == write_behind[0])
+    print("rollups match:", synchronous[1] == write_behind[1])
+
+if __name__ == "__main__":
+    main()
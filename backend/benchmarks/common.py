@@ -0,0 +1,54 @@
+"""Shared setup for the backend benchmarks.
+
+Benchmarks talk to the operations layer directly, against a throwaway SQLite file by
+default or any database given with --url (use an empty Postgres database for realistic numbers).
+"""
+import argparse
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--url", default=None, help="Database URL (default: temporary SQLite file)")
+    return parser
+
+def make_session_factory(url: str = None):
+    """Create a fresh schema and return a session factory bound to it"""
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def seed_group(db, member_count: int, name: str = "Bench Group") -> models.Group:
+    """Create a group with `member_count` fresh users and zero balances"""
+    users = [
+        models.User(name=f"{name} member {i}", email=f"{name.lower().replace(' ', '.')}.{i}@bench.local")
+        for i in range(member_count)
+    ]
+    group = models.Group(name=name, users=users)
+    db.add(group)
+    db.flush()
+    db.add_all([models.Balance(user_id=user.id, group_id=group.id, balance=0.0) for user in users])
+    db.commit()
+    return group
+
+@contextmanager
+def timed(label: str, count: int = None):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if count:
+        print(f"{label}: {elapsed:.3f}s ({count / elapsed:,.0f}/s)")
+    else:
+        print(f"{label}: {elapsed:.3f}s")